@@ -0,0 +1,366 @@
+# bench_userinput.py
+"""Hot-path benchmarks for the userinput.py prompt window.
+
+Each case runs in a fresh subprocess against a real PromptInput (under Xvfb
+when there is no display) with synthetic files, and reports timings in
+milliseconds plus peak RSS. Results are written as JSON and can be compared
+against a saved baseline:
+
+    python bench_userinput.py --output bench.json
+    python bench_userinput.py --baseline bench.json --threshold 0.2
+
+The run exits with status 1 if any metric regressed past the threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+IMAGE_SIZES = [(640, 480), (1920, 1080), (4000, 3000), (6000, 4000)]
+IMAGES_PER_SIZE = 10
+NON_IMAGE_FILES = 200
+DROP_COUNTS = [10, 100, 1000, 10000]
+PASTE_SIZES = [(1920, 1080), (3840, 2160), (5120, 2880), (7680, 2160)]
+CLEAR_COUNTS = [10, 1000, 10000]
+NOISE_FLOOR_MS = 1.0  # differences smaller than this are never reported as regressions
+DRAIN_TIMEOUT = 120
+
+
+def peak_rss_mb():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+# --- synthetic data ---------------------------------------------------------
+
+def make_data(data_dir):
+    """Create the synthetic attachments once; later runs reuse them"""
+    marker = os.path.join(data_dir, ".complete")
+    if os.path.exists(marker):
+        return
+    from PIL import Image
+
+    for width, height in IMAGE_SIZES:
+        folder = os.path.join(data_dir, f"images_{width}x{height}")
+        os.makedirs(folder, exist_ok=True)
+        base = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        for i in range(IMAGES_PER_SIZE):
+            # Vary a corner pixel so every file has distinct content
+            img = base.copy()
+            img.putpixel((0, 0), (i, i, i))
+            ext = "jpg" if i % 2 == 0 else "png"
+            img.save(os.path.join(folder, f"img_{i:03d}.{ext}"), quality=90)
+
+    # Plain files for drops and clears; sizes differ so content dedup never needs to hash
+    folder = os.path.join(data_dir, "files")
+    os.makedirs(folder, exist_ok=True)
+    for i in range(max(DROP_COUNTS + CLEAR_COUNTS + [NON_IMAGE_FILES])):
+        ext = (".txt", ".pdf", ".csv", ".zip", ".log")[i % 5]
+        with open(os.path.join(folder, f"file_{i:05d}{ext}"), "wb") as f:
+            f.write(b"x" * (i + 1))
+
+    open(marker, "w").close()
+
+
+def data_files(data_dir, count):
+    folder = os.path.join(data_dir, "files")
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))[:count]]
+
+
+# --- helpers used inside a case subprocess ---------------------------------
+
+def new_app():
+    import userinput
+    app = userinput.PromptInput()
+    # Benchmarks must never block on a modal dialog
+    for name in ("showinfo", "showwarning", "showerror"):
+        setattr(userinput.messagebox, name, lambda *a, **k: None)
+    app.root.update()
+    return app
+
+
+def drain(app):
+    """Pump the event loop until all background work has been delivered"""
+    deadline = time.perf_counter() + DRAIN_TIMEOUT
+    while time.perf_counter() < deadline:
+        app.root.update()
+        if not app.busy():
+            app.root.update()
+            return
+        time.sleep(0.001)
+    raise TimeoutError("background work did not finish")
+
+
+def close(app):
+    app.shutdown()
+    app.root.destroy()
+
+
+class DropEvent:
+    def __init__(self, app, paths):
+        # The same Tcl list encoding tkdnd uses for <<Drop>> data
+        self.data = app.root.tk.call("list", *paths)
+
+
+# --- cases ------------------------------------------------------------------
+
+def case_startup(data_dir, spawned_at):
+    started = time.perf_counter()
+    import userinput  # noqa: F401
+    imported = time.perf_counter()
+    app = new_app()
+    first_frame = time.perf_counter()
+    result = {
+        "spawn_to_first_frame_ms": ms(time.time() - spawned_at),
+        "import_ms": ms(imported - started),
+        "construct_to_first_frame_ms": ms(first_frame - imported),
+    }
+    close(app)
+    return result
+
+
+def case_add_images(data_dir, width, height):
+    app = new_app()
+    folder = os.path.join(data_dir, f"images_{width}x{height}")
+    paths = [os.path.join(folder, name) for name in sorted(os.listdir(folder))]
+    result = {}
+    for label in ("cold", "warm"):
+        add_times = []
+        started = time.perf_counter()
+        for path in paths:
+            t = time.perf_counter()
+            app.add_file_to_ui(path, os.path.basename(path))
+            add_times.append(time.perf_counter() - t)
+            # Each row is scrolled into view, so its thumbnail is decoded (or read from cache)
+            drain(app)
+        result[f"{label}_add_file_to_ui_ms"] = ms(statistics.median(add_times))
+        result[f"{label}_per_file_to_thumbnail_ms"] = ms((time.perf_counter() - started) / len(paths))
+        app.clear_all_files()
+        drain(app)
+    close(app)
+    return result
+
+
+def case_add_non_images(data_dir):
+    app = new_app()
+    add_times = []
+    for path in data_files(data_dir, NON_IMAGE_FILES):
+        t = time.perf_counter()
+        app.add_file_to_ui(path, os.path.basename(path))
+        add_times.append(time.perf_counter() - t)
+    app.root.update()
+    close(app)
+    return {"add_file_to_ui_ms": ms(statistics.median(add_times)),
+            "add_file_to_ui_p95_ms": ms(sorted(add_times)[int(len(add_times) * 0.95)])}
+
+
+def case_drop(data_dir, count):
+    app = new_app()
+    event = DropEvent(app, data_files(data_dir, count))
+    started = time.perf_counter()
+    app.handle_drop(event)
+    returned = time.perf_counter()
+    drain(app)
+    settled = time.perf_counter()
+    close(app)
+    return {"handle_drop_ms": ms(returned - started), "drop_to_idle_ms": ms(settled - started)}
+
+
+def case_paste(data_dir, width, height, screenshot_format):
+    from PIL import Image, ImageGrab
+    image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+    ImageGrab.grabclipboard = lambda *a, **k: image
+
+    app = new_app()
+    app.screenshot_format = screenshot_format
+    started = time.perf_counter()
+    app.paste_image()
+    returned = time.perf_counter()
+    app.root.update()
+    visible = time.perf_counter()
+    drain(app)
+    persisted = time.perf_counter()
+    close(app)
+    result = {"paste_image_ms": ms(returned - started), "capture_to_visible_ms": ms(visible - started)}
+    if screenshot_format != "memory":
+        result["capture_to_persisted_ms"] = ms(persisted - started)
+    return result
+
+
+def case_clear(data_dir, count):
+    app = new_app()
+    app.add_files(data_files(data_dir, count), quiet=True)
+    drain(app)
+    started = time.perf_counter()
+    app.clear_all_files()
+    app.root.update()
+    cleared = time.perf_counter()
+    close(app)
+    return {"clear_all_files_ms": ms(cleared - started)}
+
+
+def all_cases():
+    """name -> (function, args)"""
+    cases = {"startup": (case_startup, ())}
+    for width, height in IMAGE_SIZES:
+        cases[f"add_image_{width}x{height}"] = (case_add_images, (width, height))
+    cases["add_non_image"] = (case_add_non_images, ())
+    for count in DROP_COUNTS:
+        cases[f"handle_drop_{count}"] = (case_drop, (count,))
+    for width, height in PASTE_SIZES:
+        for screenshot_format in ("png", "memory"):
+            cases[f"paste_{width}x{height}_{screenshot_format}"] = (case_paste, (width, height, screenshot_format))
+    for count in CLEAR_COUNTS:
+        cases[f"clear_all_files_{count}"] = (case_clear, (count,))
+    return cases
+
+
+def run_case_in_process(name, data_dir, spawned_at):
+    sys.path.insert(0, HERE)
+    func, args = all_cases()[name]
+    if func is case_startup:
+        result = func(data_dir, spawned_at)
+    else:
+        result = func(data_dir, *args)
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    print(json.dumps(result))
+
+
+# --- driver -----------------------------------------------------------------
+
+def start_virtual_display():
+    """Return (env, process) with DISPLAY pointing at an Xvfb server if none is available"""
+    env = dict(os.environ)
+    if sys.platform in ("win32", "darwin") or env.get("DISPLAY"):
+        return env, None
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        sys.exit("No DISPLAY and Xvfb is not installed; install Xvfb or run under a display.")
+    display = f":{100 + os.getpid() % 400}"
+    process = subprocess.Popen([xvfb, display, "-screen", "0", "1280x1024x24", "-nolisten", "tcp"],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    env["DISPLAY"] = display
+    return env, process
+
+
+def run_case(name, data_dir, env):
+    with tempfile.TemporaryDirectory(prefix="userinput-bench-") as scratch:
+        case_env = dict(env)
+        # Fresh caches per case, so "cold" really is cold
+        case_env["USERINPUT_CACHE_DIR"] = os.path.join(scratch, "cache")
+        case_env["USERINPUT_SCREENSHOT_DIR"] = os.path.join(scratch, "screenshots")
+        spawned_at = time.time()
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "--run-case", name,
+                               "--data-dir", data_dir, "--spawned-at", repr(spawned_at)],
+                              env=case_env, capture_output=True, text=True)
+    if proc.returncode != 0:
+        raise RuntimeError(f"case {name} failed:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def median_results(runs):
+    metrics = {}
+    for run in runs:
+        for key, value in run.items():
+            metrics.setdefault(key, []).append(value)
+    return {key: round(statistics.median(values), 3) for key, values in metrics.items()}
+
+
+def compare(results, baseline, threshold):
+    """Print a comparison table; return the list of regressed (case, metric) pairs"""
+    regressions = []
+    print(f"\n{'case':<34} {'metric':<34} {'baseline':>10} {'current':>10} {'change':>8}")
+    for case, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(case, {}).get(metric)
+            if old is None:
+                continue
+            change = (value - old) / old if old else 0.0
+            regressed = change > threshold and value - old > NOISE_FLOOR_MS
+            flag = "  REGRESSED" if regressed else ""
+            print(f"{case:<34} {metric:<34} {old:>10.2f} {value:>10.2f} {change:>+7.1%}{flag}")
+            if regressed:
+                regressions.append((case, metric))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the userinput.py prompt window.")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="compare against a previous results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative slowdown that counts as a regression (default 0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the median is reported")
+    parser.add_argument("--case", action="append", default=[],
+                        help="only run cases whose name starts with this prefix (repeatable)")
+    parser.add_argument("--data-dir", help="where synthetic files are generated (kept between runs)")
+    parser.add_argument("--list", action="store_true", help="list case names and exit")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    parser.add_argument("--spawned-at", type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_case:
+        run_case_in_process(args.run_case, args.data_dir, args.spawned_at)
+        return 0
+
+    names = [name for name in all_cases() if not args.case or any(name.startswith(p) for p in args.case)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    data_dir = args.data_dir or os.path.join(tempfile.gettempdir(), "userinput-bench-data")
+    os.makedirs(data_dir, exist_ok=True)
+    make_data(data_dir)
+
+    env, xvfb = start_virtual_display()
+    results = {}
+    try:
+        for name in names:
+            runs = [run_case(name, data_dir, env) for _ in range(args.repeat)]
+            results[name] = median_results(runs)
+            summary = ", ".join(f"{key}={value}" for key, value in results[name].items())
+            print(f"{name}: {summary}", flush=True)
+    finally:
+        if xvfb is not None:
+            xvfb.terminate()
+
+    report = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metric(s) regressed by more than {args.threshold:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import gzip
+import io
+import json
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+import userinput
+
+
+@pytest.fixture
+def attachments(tmp_path):
+    text = tmp_path / "notes.txt"
+    text.write_text("hello world\n" * 500, encoding="utf-8")
+    image = tmp_path / "pixel.png"
+    image.write_bytes(b"\x89PNG\r\n\x1a\n" + os.urandom(4096))
+    items = [userinput.Attachment(str(path), path.name, os.stat(path)) for path in (text, image)]
+    items.append(userinput.Attachment(str(tmp_path / "gone.txt"), "gone.txt"))
+    return items
+
+
+def bundle(items, archive_format, compression):
+    out = io.BytesIO()
+    userinput.write_bundle(out, "the prompt", items, archive_format, compression)
+    out.seek(0)
+    return out
+
+
+def test_tar_bundle_round_trip(attachments):
+    with tarfile.open(fileobj=bundle(attachments, "tar", "gzip")) as archive:
+        assert archive.getnames()[:2] == ["manifest.json", "prompt.txt"]
+        manifest = json.load(archive.extractfile("manifest.json"))
+        assert manifest["prompt"] == "the prompt"
+        assert archive.extractfile("prompt.txt").read() == b"the prompt"
+        records = manifest["attachments"]
+        assert [(r["member"], r["encoding"]) for r in records] == [
+            ("files/0001/notes.txt.gz", "gzip"), ("files/0002/pixel.png", None), (None, None)]
+        for record, item in zip(records[:2], attachments):
+            data = archive.extractfile(record["member"]).read()
+            if record["encoding"] == "gzip":
+                data = gzip.decompress(data)
+            with open(item.path, "rb") as f:
+                assert data == f.read()
+
+
+def test_tar_bundle_to_a_real_file(attachments, tmp_path):
+    path = tmp_path / "bundle.tar"
+    with open(path, "wb") as out:
+        userinput.write_bundle(out, "the prompt", attachments, "tar", "none")
+    assert path.stat().st_size % tarfile.RECORDSIZE == 0
+    with tarfile.open(path) as archive:
+        with open(attachments[1].path, "rb") as f:
+            assert archive.extractfile("files/0002/pixel.png").read() == f.read()
+        assert archive.extractfile("files/0001/notes.txt").read() == b"hello world\n" * 500
+
+
+def test_zip_bundle_round_trip(attachments):
+    with zipfile.ZipFile(bundle(attachments, "zip", "auto")) as archive:
+        manifest = json.loads(archive.read("manifest.json"))
+        records = manifest["attachments"]
+        assert [(r["member"], r["encoding"]) for r in records] == [
+            ("files/0001/notes.txt", "deflate"), ("files/0002/pixel.png", None), (None, None)]
+        assert archive.getinfo("files/0001/notes.txt").compress_type == zipfile.ZIP_DEFLATED
+        assert archive.getinfo("files/0002/pixel.png").compress_type == zipfile.ZIP_STORED
+        assert archive.read("files/0001/notes.txt") == b"hello world\n" * 500
+
+
+def test_bundle_member_names_stay_inside_the_archive():
+    assert userinput.member_name(3, "../../etc/passwd") == "files/0003/etc/passwd"
+    assert userinput.member_name(1, "project\\src\\main.py") == "files/0001/project/src/main.py"
+    assert userinput.member_name(2, "..") == "files/0002/file"
+
+
+def test_unknown_bundle_format(attachments):
+    with pytest.raises(ValueError):
+        bundle(attachments, "rar", "auto")
+
+
+def test_failed_bundle_leaves_no_partial_file(tmp_path, monkeypatch, capsys):
+    def disk_full(out, *args):
+        out.write(b"partial")
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(userinput, "write_bundle", disk_full)
+    path = tmp_path / "out.tar"
+    with pytest.raises(OSError):
+        userinput.deliver_submission("the prompt", [], bundle=str(path))
+    assert os.listdir(tmp_path) == []
+    assert capsys.readouterr().out == ""
+
+
+def test_bundle_directory_must_exist(tmp_path):
+    with pytest.raises(SystemExit):
+        userinput.parse_args(["--prompt", "hi", "--bundle", str(tmp_path / "missing" / "out.tar")])
+    assert userinput.parse_args(["--bundle", str(tmp_path / "out.tar")]).bundle == str(tmp_path / "out.tar")
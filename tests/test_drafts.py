@@ -0,0 +1,147 @@
+import json
+import os
+
+import pytest
+
+import userinput
+
+
+class FakeRoot:
+    """Just enough of a Tk root for DraftJournal: after() callbacks are never run"""
+
+    def __init__(self):
+        self.scheduled = {}
+
+    def after(self, ms, callback):
+        after_id = f"after#{len(self.scheduled)}"
+        self.scheduled[after_id] = callback
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.scheduled.pop(after_id, None)
+
+
+def write_lines(path, *records):
+    path.write_text("".join(json.dumps(record) + "\n" for record in records), encoding="utf-8")
+
+
+def test_text_offset_clamps_like_tk():
+    text = "ab\ncd"
+    assert userinput.text_offset(text, "1.0") == 0
+    assert userinput.text_offset(text, "1.9") == 2
+    assert userinput.text_offset(text, "2.1") == 4
+    assert userinput.text_offset(text, "7.0") == len(text)
+
+
+def test_text_offset_counts_emoji_as_two_columns():
+    # Tk 8.6 indexes UTF-16 code units, so the rocket spans columns 1-2
+    assert userinput.text_offset("a🚀bc", "1.3") == 2
+    assert userinput.text_offset("x\na🚀bc", "2.4") == 5
+    assert userinput.text_offset("a🚀", "1.9") == 2
+    assert userinput.advance_index("1.0", "a🚀") == "1.3"
+
+
+def test_load_draft_replays_edits_after_emoji(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    write_lines(path, {"op": "snapshot", "text": "a🚀bc", "files": []},
+                {"op": "insert", "index": "1.3", "text": "X"},
+                {"op": "delete", "index": "1.5", "text": "c"})
+    assert userinput.load_draft(str(path)) == ("a🚀Xb", {})
+
+
+def test_draft_journal_coalesces_typing_after_emoji(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    journal = userinput.DraftJournal(str(path), FakeRoot(), lambda: "", lambda: [])
+    journal.text_changed("insert", "1.0", "🚀")
+    journal.text_changed("insert", "1.2", "a")
+    journal.close()
+    assert len(path.read_text(encoding="utf-8").splitlines()) == 1
+    assert userinput.load_draft(str(path)) == ("🚀a", {})
+
+
+def test_load_draft_without_journal(tmp_path):
+    assert userinput.load_draft(str(tmp_path / "draft.jsonl")) is None
+
+
+def test_load_draft_replays_records(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    write_lines(path,
+                {"op": "snapshot", "text": "hello\nworld", "files": [{"path": "/a", "name": "a"}]},
+                {"op": "insert", "index": "1.5", "text": ","},
+                {"op": "delete", "index": "2.0", "text": "wor"},
+                {"op": "attach", "path": "/b", "name": "b"},
+                {"op": "remove", "path": "/a"})
+    assert userinput.load_draft(str(path)) == ("hello,\nld", {"/b": "b"})
+
+
+def test_load_draft_stops_at_torn_write(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    write_lines(path, {"op": "text", "text": "kept"}, {"op": "attach", "path": "/a", "name": "a"})
+    with open(path, "a", encoding="utf-8") as f:
+        f.write('{"op": "insert", "ind')
+    assert userinput.load_draft(str(path)) == ("kept", {"/a": "a"})
+
+
+def test_load_draft_clear_drops_files(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    write_lines(path, {"op": "attach", "path": "/a", "name": "a"}, {"op": "clear"},
+                {"op": "attach", "path": "/b", "name": "b"})
+    assert userinput.load_draft(str(path)) == ("", {"/b": "b"})
+
+
+def test_draft_journal_coalesces_typing(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    journal = userinput.DraftJournal(str(path), FakeRoot(), lambda: "", lambda: [])
+    for column, char in enumerate("abc"):
+        journal.text_changed("insert", f"1.{column}", char)
+    journal.text_changed("delete", "1.2", "c")
+    journal.text_changed("delete", "1.1", "b")  # backspace
+    journal.record({"op": "attach", "path": "/a", "name": "a"})
+    journal.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert [json.loads(line)["op"] for line in lines] == ["insert", "delete", "attach"]
+    assert userinput.load_draft(str(path)) == ("a", {"/a": "a"})
+
+
+def test_draft_journal_compacts_to_snapshot(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    files = [{"path": "/a", "name": "a"}]
+    journal = userinput.DraftJournal(str(path), FakeRoot(), lambda: "xyz", lambda: files, compact_after=2)
+    journal.record({"op": "text", "text": "xyz"})
+    journal.record({"op": "attach", "path": "/a", "name": "a"})
+    journal.flush()
+    journal.close()
+    lines = path.read_text(encoding="utf-8").splitlines()
+    assert len(lines) == 1 and json.loads(lines[0])["op"] == "snapshot"
+    assert userinput.load_draft(str(path)) == ("xyz", {"/a": "a"})
+
+
+def test_draft_journal_close_never_reads_the_widget(tmp_path):
+    def destroyed():
+        raise RuntimeError("the window is gone")
+
+    path = tmp_path / "draft.jsonl"
+    journal = userinput.DraftJournal(str(path), FakeRoot(), destroyed, lambda: [], compact_after=1)
+    journal.record({"op": "attach", "path": "/a", "name": "a"})
+    journal.close()
+    assert userinput.load_draft(str(path)) == ("", {"/a": "a"})
+
+
+def test_draft_journal_discard(tmp_path):
+    path = tmp_path / "draft.jsonl"
+    journal = userinput.DraftJournal(str(path), FakeRoot(), lambda: "", lambda: [])
+    journal.record({"op": "text", "text": "sent"})
+    journal.flush()
+    journal.discard()
+    journal.close()
+    assert userinput.load_draft(str(path)) is None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="msvcrt locks are per process")
+def test_lock_file_is_exclusive(tmp_path):
+    path = str(tmp_path / "draft.jsonl.lock")
+    lock = userinput.lock_file(path)
+    assert lock is not None
+    assert userinput.lock_file(path) is None
+    lock.close()
+    userinput.lock_file(path).close()
@@ -0,0 +1,84 @@
+import pytest
+
+import userinput
+
+
+def run_inline(func, *args):
+    func(*args)
+
+
+def scan(roots, **options):
+    batches, done = [], []
+    scanner = userinput.FolderScanner(run_inline, [str(root) for root in roots],
+                                      lambda _, batch: batches.extend(batch),
+                                      lambda _, *result: done.append(result), **options)
+    scanner._run()
+    assert len(done) == 1
+    return [name for _, name, _ in batches], done[0]
+
+
+@pytest.fixture
+def tree(tmp_path):
+    root = tmp_path / "project"
+    (root / "src").mkdir(parents=True)
+    (root / ".git").mkdir()
+    (root / "node_modules" / "dep").mkdir(parents=True)
+    (root / "README.md").write_text("readme")
+    (root / "src" / "main.py").write_text("print()")
+    (root / "src" / "data.bin").write_bytes(bytes(100))
+    (root / ".git" / "HEAD").write_text("ref")
+    (root / "node_modules" / "dep" / "index.js").write_text("")
+    try:
+        (root / "src" / "loop").symlink_to(root, target_is_directory=True)
+    except OSError:
+        pass  # no symlink permission (Windows)
+    return root
+
+
+def test_folder_scan_skips_excluded_and_loops(tree):
+    names, (files, total, limit) = scan([tree])
+    assert names == ["project/README.md", "project/src/data.bin", "project/src/main.py"]
+    assert (files, total, limit) == (3, 6 + 100 + 7, None)
+
+
+def test_folder_scan_include_globs(tree):
+    names, _ = scan([tree], include=["*.py", "project/README.md"])
+    assert names == ["project/README.md", "project/src/main.py"]
+
+
+def test_folder_scan_extra_excludes(tree):
+    names, _ = scan([tree], exclude=userinput.FOLDER_EXCLUDE + ("src",))
+    assert names == ["project/README.md"]
+
+
+def test_folder_scan_file_limit(tree):
+    names, (files, _, limit) = scan([tree], max_files=2)
+    assert names == ["project/README.md", "project/src/data.bin"]
+    assert files == 2 and limit == "2 file limit"
+
+
+def test_folder_scan_size_limit(tree):
+    names, (files, total, limit) = scan([tree], max_bytes=50)
+    assert names == ["project/README.md"]
+    assert (files, total) == (1, 6) and "size limit" in limit
+
+
+def test_folder_scan_cancelled(tree):
+    batches, done = [], []
+    scanner = userinput.FolderScanner(run_inline, [str(tree)], lambda _, batch: batches.extend(batch),
+                                      lambda _, *result: done.append(result))
+    scanner.cancel()
+    scanner._run()
+    assert batches == [] and done == [(0, 0, None)]
+
+
+def test_folder_scan_batches_and_passes_stats(tmp_path, monkeypatch):
+    monkeypatch.setattr(userinput, "FOLDER_BATCH_SIZE", 2)
+    for index in range(5):
+        (tmp_path / f"{index}.txt").write_text("x" * index)
+    batches = []
+    scanner = userinput.FolderScanner(run_inline, [str(tmp_path)], lambda _, batch: batches.append(batch),
+                                      lambda *_: None)
+    scanner._run()
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [st.st_size for batch in batches for _, _, st in batch] == [0, 1, 2, 3, 4]
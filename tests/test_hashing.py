@@ -0,0 +1,89 @@
+import hashlib
+import json
+import os
+
+import userinput
+
+
+def make_file(path, data):
+    path.write_bytes(data)
+    return str(path), userinput.file_cache_key(str(path))
+
+
+def loaded_cache(tmp_path, **options):
+    cache = userinput.HashCache(str(tmp_path / "digests.json"), **options)
+    cache.load()
+    return cache
+
+
+def test_hash_file_matches_blake2b(tmp_path):
+    data = os.urandom(3 * 1024 + 7)
+    path, _ = make_file(tmp_path / "data.bin", data)
+    assert userinput.hash_file(path, chunk_size=1024) == hashlib.blake2b(data, digest_size=32).hexdigest()
+
+
+def test_sample_file_only_reads_the_ends(tmp_path):
+    head, tail = b"h" * 16, b"t" * 16
+    a, _ = make_file(tmp_path / "a", head + b"x" * 100 + tail)
+    b, _ = make_file(tmp_path / "b", head + b"y" * 100 + tail)
+    c, _ = make_file(tmp_path / "c", head + b"y" * 100 + b"T" * 16)
+    assert userinput.sample_file(a, 132, 16) == userinput.sample_file(b, 132, 16)
+    assert userinput.sample_file(a, 132, 16) != userinput.sample_file(c, 132, 16)
+
+
+def test_hash_cache_persists_and_caps_entries(tmp_path):
+    cache = loaded_cache(tmp_path, max_entries=2)
+    for name in "abc":
+        cache.put((name, 1, 1), name * 4)
+    assert cache.peek(("a", 1, 1)) is None
+    assert cache.peek(("c", 1, 1)) == "cccc"
+    cache.save()
+    with open(cache.filepath, encoding="utf-8") as f:
+        assert len(json.load(f)) == 2
+    reloaded = loaded_cache(tmp_path)
+    assert reloaded.get(("b", 1, 1)) == "bbbb"
+
+
+def test_hash_cache_reuses_digests(tmp_path, monkeypatch):
+    path, key = make_file(tmp_path / "data.bin", b"content")
+    cache = loaded_cache(tmp_path)
+    first = cache.digest(path, key)
+    monkeypatch.setattr(userinput, "hash_file", lambda filepath: "rehashed")
+    assert cache.digest(path, key) == first
+    # A modified file has a new (path, mtime, size) key and is hashed again
+    assert cache.digest(path, (key[0], key[1] + 1, key[2])) == "rehashed"
+
+
+def test_find_duplicate_digests_small_files(tmp_path):
+    cache = loaded_cache(tmp_path)
+    a, a_key = make_file(tmp_path / "a.txt", b"same")
+    b, b_key = make_file(tmp_path / "b.txt", b"same")
+    c, c_key = make_file(tmp_path / "c.txt", b"diff")
+    digests = userinput.find_duplicate_digests(cache, c, c_key, [(a, a_key), (b, b_key)])
+    assert digests[a] == digests[b] != digests[c]
+
+
+def test_find_duplicate_digests_prefilters_large_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(userinput, "HASH_PREFILTER_MIN", 64)
+    hashed = []
+    real_hash = userinput.hash_file
+    monkeypatch.setattr(userinput, "hash_file", lambda path: hashed.append(os.path.basename(path))
+                        or real_hash(path))
+    cache = loaded_cache(tmp_path)
+    new, new_key = make_file(tmp_path / "new.bin", b"A" * 100)
+    other, other_key = make_file(tmp_path / "other.bin", b"B" * 100)
+    # Different samples: nothing is hashed, and the new file has no known digest
+    assert userinput.find_duplicate_digests(cache, new, new_key, [(other, other_key)]) == {new: None}
+    assert hashed == []
+    copy, copy_key = make_file(tmp_path / "copy.bin", b"A" * 100)
+    digests = userinput.find_duplicate_digests(cache, new, new_key, [(other, other_key), (copy, copy_key)])
+    assert sorted(hashed) == ["copy.bin", "new.bin"]
+    assert digests == {new: digests[copy], copy: digests[copy]}
+
+
+def test_find_duplicate_digests_skips_vanished_peers(tmp_path):
+    cache = loaded_cache(tmp_path)
+    a, a_key = make_file(tmp_path / "a.txt", b"same")
+    b, b_key = make_file(tmp_path / "b.txt", b"same")
+    os.remove(b)
+    assert list(userinput.find_duplicate_digests(cache, a, a_key, [(b, b_key)])) == [a]
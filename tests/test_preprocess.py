@@ -0,0 +1,69 @@
+import os
+
+import pytest
+
+import userinput
+
+Image = pytest.importorskip("PIL.Image")
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "photo.png"
+    Image.effect_noise((1200, 800), 60).convert("RGB").save(path)
+    return str(path)
+
+
+def test_downscales_and_reencodes(photo, tmp_path):
+    digest, path, size = userinput.preprocess_image(photo, str(tmp_path), 300, "webp", 80)
+    assert digest == userinput.hash_file(photo)
+    assert path.endswith(".webp") and size == os.path.getsize(path) < os.path.getsize(photo)
+    with Image.open(path) as img:
+        assert img.format == "WEBP" and img.size == (300, 200)
+
+
+def test_outputs_are_cached_by_digest(photo, tmp_path):
+    digest, path, _ = userinput.preprocess_image(photo, str(tmp_path), 300, "jpeg", 80)
+    # A cache hit needs neither the source file nor a decode
+    missing = str(tmp_path / "moved-away.png")
+    assert userinput.preprocess_image(missing, str(tmp_path), 300, "jpeg", 80, digest)[1] == path
+    other = userinput.preprocess_image(photo, str(tmp_path), 300, "jpeg", 60, digest)[1]
+    assert other != path
+
+
+def test_keeps_originals_that_would_not_shrink(tmp_path):
+    source = tmp_path / "dot.png"
+    Image.new("L", (4, 4)).save(source)
+    out = tmp_path / "out"
+    out.mkdir()
+    _, path, size = userinput.preprocess_image(str(source), str(out), 300, "png", 80)
+    assert (path, size) == (None, 0)
+    # The decision is cached too, as an empty file
+    assert [entry.stat().st_size for entry in os.scandir(out)] == [0]
+
+
+def test_jpeg_flattens_transparency_onto_white(tmp_path):
+    source = tmp_path / "logo.png"
+    img = Image.effect_noise((400, 400), 60).convert("RGBA")
+    img.putalpha(0)
+    img.save(source)
+    _, path, _ = userinput.preprocess_image(str(source), str(tmp_path), 100, "jpeg", 90)
+    with Image.open(path) as out:
+        assert out.mode == "RGB"
+        assert all(channel > 245 for channel in out.getpixel((50, 50)))
+
+
+def test_animations_are_left_alone(tmp_path):
+    source = tmp_path / "anim.gif"
+    frames = [Image.effect_noise((300, 300), 60).convert("P") for _ in range(3)]
+    frames[0].save(source, save_all=True, append_images=frames[1:])
+    assert userinput.preprocess_image(str(source), str(tmp_path), 100, "webp", 80)[1:] == (None, 0)
+
+
+def test_trim_directory_evicts_least_recently_used(tmp_path):
+    for index in range(4):
+        path = tmp_path / f"{index}.webp"
+        path.write_bytes(bytes(100))
+        os.utime(path, (1000 + index, 1000 + index))
+    userinput.trim_directory(str(tmp_path), 350)
+    assert sorted(os.listdir(tmp_path)) == ["2.webp", "3.webp"]
@@ -0,0 +1,75 @@
+import zipfile
+
+import pytest
+
+import userinput
+
+
+def test_preview_empty_file(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert userinput.load_preview(str(path)) == {"kind": None, "text": "Empty file", "image": None}
+
+
+def test_preview_text_shows_first_lines(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("\nfirst line\n\nsecond line\nthird line\n", encoding="utf-8")
+    preview = userinput.load_preview(str(path))
+    assert preview["kind"] == "text"
+    assert preview["text"] == "first line\nsecond line"
+
+
+def test_preview_text_drops_partial_last_line(tmp_path):
+    path = tmp_path / "log.txt"
+    line = "x" * 99 + "\n"
+    path.write_text("a\n" + line * (userinput.PREVIEW_HEAD_BYTES // len(line) + 10), encoding="utf-8")
+    preview = userinput.load_preview(str(path))
+    assert preview["text"].splitlines()[0] == "a"
+
+
+def test_preview_table_columns(tmp_path):
+    path = tmp_path / "table.csv"
+    path.write_text("name;size;kind\nx;1;a\ny;2;b\n", encoding="utf-8")
+    preview = userinput.load_preview(str(path))
+    assert preview["kind"] == "table"
+    assert preview["text"] == "3 columns: name, size, kind\nx;1;a"
+
+
+def test_preview_sniffs_mislabelled_zip(tmp_path):
+    path = tmp_path / "archive.txt"
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("a.txt", "a" * 1000)
+        archive.writestr("b.txt", "b" * 24)
+    preview = userinput.load_preview(str(path))
+    assert preview["kind"] == "zip"
+    assert preview["text"] == "2 entries · 1.0 KB uncompressed"
+
+
+def test_preview_binary_and_image_signatures(tmp_path):
+    png = tmp_path / "shot.dat"
+    png.write_bytes(b"\x89PNG\r\n\x1a\n" + bytes(32))
+    blob = tmp_path / "blob.txt"
+    blob.write_bytes(b"\x00\x01\x02binary")
+    assert userinput.load_preview(str(png))["kind"] == "image"
+    assert userinput.load_preview(str(blob)) == {"kind": None, "text": "", "image": None}
+
+
+@pytest.mark.skipif(userinput.pdf_renderer() is not None, reason="a renderer reports its own page count")
+def test_preview_pdf_page_count(tmp_path):
+    path = tmp_path / "doc.bin"
+    path.write_bytes(b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n"
+                     b"2 0 obj << /Type /Pages /Kids [3 0 R 4 0 R 5 0 R] /Count 3 >> endobj\n%%EOF\n")
+    preview = userinput.load_preview(str(path))
+    assert preview["kind"] == "pdf"
+    assert preview["text"] == "3 pages"
+
+
+def test_preview_bmp_needs_a_real_header(tmp_path):
+    text = tmp_path / "sales.txt"
+    text.write_text("BMW quarterly sales\nQ1 up 4%\n", encoding="utf-8")
+    bmp = tmp_path / "pixel.dat"
+    bmp.write_bytes(b"BM" + (70).to_bytes(4, "little") + bytes(4) + (54).to_bytes(4, "little")
+                    + (40).to_bytes(4, "little") + bytes(52))
+    assert userinput.load_preview(str(text)) == {"kind": "text", "text": "BMW quarterly sales\nQ1 up 4%",
+                                                 "image": None}
+    assert userinput.load_preview(str(bmp))["kind"] == "image"
@@ -0,0 +1,88 @@
+import json
+import os
+import time
+
+import userinput
+
+
+def make_store(directory, **caps):
+    """A store whose collector thread has stopped, so _collect runs only when a test calls it"""
+    store = userinput.ScreenshotStore(str(directory), **caps)
+    store.close()
+    return store
+
+
+def add_screenshot(store, size, age=0):
+    path = store.new_path(".png")
+    with open(path, "wb") as f:
+        f.write(bytes(size))
+    store.update(path, size)
+    store._entries[os.path.basename(path)]["created"] = time.time() - age
+    return path
+
+
+def test_age_cap_spares_attached_screenshots(tmp_path):
+    store = make_store(tmp_path, max_age=60)
+    attached = add_screenshot(store, 10, age=3600)
+    handed_out = add_screenshot(store, 10, age=3600)
+    fresh = add_screenshot(store, 10)
+    store.commit([handed_out, fresh])
+    store._collect()
+    assert os.path.exists(attached) and os.path.exists(fresh)
+    assert not os.path.exists(handed_out)
+
+
+def test_size_cap_evicts_oldest_first(tmp_path):
+    store = make_store(tmp_path, max_bytes=250)
+    paths = [add_screenshot(store, 100, age=age) for age in (300, 200, 100)]
+    store.commit(paths)
+    store._collect()
+    assert [os.path.exists(path) for path in paths] == [False, True, True]
+
+
+def test_discarded_screenshots_go_at_once(tmp_path):
+    store = make_store(tmp_path)
+    kept = add_screenshot(store, 10)
+    dropped = add_screenshot(store, 10)
+    store.release(dropped)
+    store._collect()
+    assert os.path.exists(kept) and not os.path.exists(dropped)
+    assert not store.owns(dropped)
+
+
+def test_release_all_spares_submitted_screenshots(tmp_path):
+    store = make_store(tmp_path)
+    submitted = add_screenshot(store, 10)
+    draft = add_screenshot(store, 10)
+    store.commit([submitted])
+    store.release_all()
+    store._collect()
+    assert os.path.exists(submitted) and not os.path.exists(draft)
+
+
+def test_unwritten_screenshots_get_a_grace_period(tmp_path):
+    store = make_store(tmp_path, max_bytes=0)
+    pending = store.new_path(".png")
+    store.commit([pending])
+    store._collect()
+    assert store.owns(pending)
+
+
+def test_manifest_round_trip(tmp_path):
+    store = make_store(tmp_path)
+    path = add_screenshot(store, 42)
+    store._save_manifest()
+    with open(tmp_path / store.MANIFEST, encoding="utf-8") as f:
+        assert json.load(f)["entries"][os.path.basename(path)]["size"] == 42
+    reopened = make_store(tmp_path)
+    assert reopened.owns(path)
+    assert not reopened.owns(str(tmp_path / "unrelated.png"))
+
+
+def test_cap_environment_variables(monkeypatch):
+    monkeypatch.setenv("USERINPUT_SCREENSHOT_MAX_MB", "1.5")
+    monkeypatch.setenv("USERINPUT_SCREENSHOT_MAX_DAYS", "soon")
+    monkeypatch.delenv("USERINPUT_SCREENSHOT_DIR", raising=False)
+    assert userinput.env_number("USERINPUT_SCREENSHOT_MAX_MB") == 1.5
+    assert userinput.env_number("USERINPUT_SCREENSHOT_MAX_DAYS") is None
+    assert userinput.env_number("USERINPUT_SCREENSHOT_DIR") is None
@@ -0,0 +1,145 @@
+import json
+import os
+import socket
+import stat
+import tempfile
+
+import pytest
+
+import userinput
+
+pytestmark = pytest.mark.skipif(not hasattr(socket, "AF_UNIX"), reason="needs Unix sockets")
+
+
+class FakeApp:
+    """Stands in for PromptInput: every session is answered at once with a canned reply"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+
+    def call_in_ui(self, func, *args):
+        func(*args)
+
+    def begin_session(self, request, reply):
+        self.requests.append(request)
+        reply(self.reply(request) if callable(self.reply) else self.reply)
+
+
+@pytest.fixture
+def socket_path():
+    # AF_UNIX paths are limited to about 100 bytes, which pytest's tmp_path can exceed
+    with tempfile.TemporaryDirectory(prefix="ui") as directory:
+        yield os.path.join(directory, "s.sock")
+
+
+def test_socket_is_private_from_the_start(socket_path, monkeypatch):
+    bind = socket.socket.bind
+    modes = []
+
+    def checked_bind(sock, address):
+        bind(sock, address)
+        modes.append(stat.S_IMODE(os.stat(address).st_mode))
+
+    monkeypatch.setattr(socket.socket, "bind", checked_bind)
+    old_umask = os.umask(0o022)
+    try:
+        server = userinput.PromptServer(FakeApp({"status": "cancelled"}), socket_path)
+        assert os.umask(0o022) == 0o022  # restored after bind
+    finally:
+        os.umask(old_umask)
+    try:
+        assert modes[0] & 0o077 == 0  # already private when bind returns
+        assert stat.S_IMODE(os.stat(socket_path).st_mode) == 0o600
+    finally:
+        server.close()
+    assert not os.path.exists(socket_path)
+
+
+@pytest.fixture
+def serve(socket_path):
+    servers = []
+
+    def start(reply):
+        app = FakeApp(reply)
+        servers.append(userinput.PromptServer(app, socket_path))
+        return app
+
+    yield start
+    for server in servers:
+        server.close()
+
+
+def exchange(path, data):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(data)
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile("rb") as f:
+            return f.readline()
+
+
+def submitted(request):
+    records = [userinput.stat_attachment(path).to_record() for path in request["files"]]
+    return {"status": "submitted", "prompt": request["prompt"] + "!", "attachments": records}
+
+
+def test_client_prints_the_submission(serve, socket_path, tmp_path, capsys):
+    app = serve(submitted)
+    attached = tmp_path / "notes.txt"
+    attached.write_text("notes")
+    args = userinput.parse_args(["--client", socket_path, "--prompt", "hi", "--file", str(attached),
+                                 "--file", str(attached), "--format", "json"])
+    assert userinput.run_client(args) == 0
+    assert app.requests == [{"request": "prompt", "prompt": "hi", "files": [str(attached)]}]
+    document = json.loads(capsys.readouterr().out)
+    assert document["prompt"] == "hi!"
+    assert [record["size"] for record in document["attachments"]] == [5]
+
+
+def test_client_reports_a_closed_window(serve, socket_path):
+    serve({"status": "cancelled"})
+    assert userinput.run_client(userinput.parse_args(["--client", socket_path])) == 1
+
+
+def test_client_without_a_server(socket_path):
+    assert userinput.run_client(userinput.parse_args(["--client", socket_path])) == 2
+
+
+def test_server_rejects_other_requests(serve, socket_path):
+    app = serve(submitted)
+    reply = json.loads(exchange(socket_path, b'{"request": "shutdown"}\n'))
+    assert reply["status"] == "error" and app.requests == []
+
+
+def test_server_survives_probes_and_bad_json(serve, socket_path):
+    app = serve({"status": "cancelled"})
+    assert exchange(socket_path, b"") == b""
+    assert exchange(socket_path, b"not json\n") == b""
+    assert json.loads(exchange(socket_path, b'{"request": "prompt"}\n')) == {"status": "cancelled"}
+    assert len(app.requests) == 1
+
+
+def test_one_server_per_socket(serve, socket_path):
+    serve({"status": "cancelled"})
+    with pytest.raises(RuntimeError):
+        userinput.PromptServer(FakeApp({"status": "cancelled"}), socket_path)
+
+
+def test_stale_socket_is_replaced(serve, socket_path):
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(socket_path)
+    stale.close()  # the file stays behind, but nothing listens
+    serve({"status": "cancelled"})
+    assert json.loads(exchange(socket_path, b'{"request": "prompt"}\n')) == {"status": "cancelled"}
+
+
+def test_client_reports_bundle_failures(serve, socket_path, tmp_path, monkeypatch):
+    def disk_full(*args):
+        raise OSError(28, "No space left on device")
+
+    serve(submitted)
+    monkeypatch.setattr(userinput, "write_bundle", disk_full)
+    args = userinput.parse_args(["--client", socket_path, "--bundle", str(tmp_path / "out.tar")])
+    assert userinput.run_client(args) == 1
+    assert os.listdir(tmp_path) == []
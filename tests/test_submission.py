@@ -0,0 +1,86 @@
+import base64
+import io
+import json
+import os
+
+import pytest
+
+import userinput
+
+
+@pytest.fixture
+def attachments(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"line one\nline two\n" * 20)
+    item = userinput.Attachment(str(path), "notes.txt", os.stat(path))
+    image = userinput.Attachment(str(tmp_path / "photo.png"), "photo.png", os.stat(path))
+    image.dimensions = (640, 480)
+    missing = userinput.Attachment(str(tmp_path / "gone.txt"), "gone.txt")
+    return [item, image, missing]
+
+
+def submission(attachments, output_format, inline_content=False):
+    out = io.StringIO()
+    userinput.write_submission(out, "the prompt", attachments, output_format, inline_content)
+    return out.getvalue()
+
+
+def test_json_document(attachments):
+    document = json.loads(submission(attachments, "json"))
+    assert document["prompt"] == "the prompt"
+    notes, image, missing = document["attachments"]
+    assert notes["exists"] and notes["size"] == 360 and notes["mime"] == "text/plain"
+    assert (image["width"], image["height"]) == (640, 480)
+    assert not missing["exists"] and missing["size"] is None
+    assert "content_base64" not in notes
+
+
+def test_ndjson_records(attachments):
+    lines = submission(attachments, "ndjson").splitlines()
+    records = [json.loads(line) for line in lines]
+    assert records[0] == {"record": "prompt", "text": "the prompt"}
+    assert [record["record"] for record in records[1:]] == ["attachment"] * 3
+    assert [record["name"] for record in records[1:]] == ["notes.txt", "photo.png", "gone.txt"]
+
+
+def test_inline_content_is_streamed_in_chunks(attachments, monkeypatch):
+    monkeypatch.setattr(userinput, "INLINE_CHUNK_SIZE", 3 * 7)
+    notes = attachments[0]
+    document = json.loads(submission([notes, attachments[2]], "json", inline_content=True))
+    with open(notes.path, "rb") as f:
+        assert base64.b64decode(document["attachments"][0]["content_base64"]) == f.read()
+    assert "content_base64" not in document["attachments"][1]
+
+
+def test_inline_content_prefers_the_optimized_copy(attachments, tmp_path):
+    optimized = tmp_path / "photo.webp"
+    optimized.write_bytes(b"webp bytes")
+    image = attachments[1]
+    image.set_optimized(str(optimized), 10)
+    record = json.loads(submission([image], "ndjson", inline_content=True).splitlines()[1])
+    assert record["optimized_path"] == str(optimized) and record["saved_bytes"] == 350
+    assert base64.b64decode(record["content_base64"]) == b"webp bytes"
+
+
+def test_inline_content_reports_unreadable_files(attachments):
+    notes = attachments[0]
+    os.remove(notes.path)
+    record = json.loads(submission([notes], "json", inline_content=True))["attachments"][0]
+    assert "content_base64" not in record and record["content_error"]
+
+
+def test_text_report(attachments):
+    text = submission(attachments, "text")
+    assert text.startswith("the prompt\n\n--- ATTACHED FILES ---\n")
+    assert f"File: {attachments[0].path}\nSize: 0.4 KB (360 bytes)\nType: .TXT\n" in text
+    assert f"File (NOT FOUND): {attachments[2].path}\n" in text
+
+
+def test_records_round_trip(attachments):
+    for item in attachments:
+        assert userinput.Attachment.from_record(item.to_record()).to_record() == item.to_record()
+
+
+def test_unknown_output_format(attachments):
+    with pytest.raises(ValueError):
+        submission(attachments, "yaml")
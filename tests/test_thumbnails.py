@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+import userinput
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def thumbnail(color, size=(10, 10)):
+    img = Image.new("RGB", size, color)
+    img.info["source_size"] = "%dx%d" % (size[0] * 8, size[1] * 8)
+    return img
+
+
+def test_memory_budget_evicts_least_recently_used(tmp_path):
+    cache = userinput.ThumbnailCache(str(tmp_path), memory_budget=2 * 10 * 10 * 3)
+    cache.put("a", thumbnail("red"))
+    cache.put("b", thumbnail("green"))
+    assert cache.peek("a") is not None  # a is now the most recent
+    cache.put("c", thumbnail("blue"))
+    assert cache.peek("b") is None
+    assert cache.peek("a") is not None and cache.peek("c") is not None
+
+
+def test_disk_copy_survives_memory_eviction(tmp_path):
+    cache = userinput.ThumbnailCache(str(tmp_path))
+    cache.put("a", thumbnail("red"))
+    cache.release("a")
+    assert cache.peek("a") is None
+    img = cache.get("a")
+    assert img.getpixel((0, 0)) == (255, 0, 0)
+    assert userinput.source_dimensions(img) == (80, 80)
+    assert cache.peek("a") is img
+
+
+def test_release_all_keeps_disk_copies(tmp_path):
+    cache = userinput.ThumbnailCache(str(tmp_path))
+    cache.put("a", thumbnail("red"))
+    cache.release_all()
+    assert cache.peek("a") is None
+    assert cache.get("a") is not None
+
+
+def test_disk_budget_evicts_oldest_files(tmp_path):
+    cache = userinput.ThumbnailCache(str(tmp_path))
+    for index, key in enumerate("abcd"):
+        cache.put(key, thumbnail((index * 60, 0, 0), (40, 40)))
+        os.utime(cache._disk_path(key), (1000 + index, 1000 + index))
+    sizes = {key: os.path.getsize(cache._disk_path(key)) for key in "abcd"}
+    # e overflows the budget, so the oldest files go until 80% of it is left
+    cache.disk_budget = sum(sizes.values()) - 1
+    cache._disk_bytes = None
+    cache.put("e", thumbnail("white", (40, 40)))
+    kept = {key for key in "abcde" if os.path.exists(cache._disk_path(key))}
+    assert "a" not in kept and "e" in kept
+    total = sum(entry.stat().st_size for entry in os.scandir(tmp_path))
+    assert total <= cache.disk_budget * 0.8
+
+
+def test_load_cached_thumbnail_decodes_once(tmp_path, monkeypatch):
+    source = tmp_path / "photo.png"
+    Image.new("RGB", (400, 300), "red").save(source)
+    decodes = []
+    real_load = userinput.load_thumbnail
+    monkeypatch.setattr(userinput, "load_thumbnail", lambda path: decodes.append(path) or real_load(path))
+    cache = userinput.ThumbnailCache(str(tmp_path / "cache"))
+    os.makedirs(cache.directory)
+    key, img = userinput.load_cached_thumbnail(cache, str(source))
+    assert img.size == (80, 60) and userinput.source_dimensions(img) == (400, 300)
+    assert userinput.load_cached_thumbnail(cache, str(source))[1] is img
+    assert decodes == [str(source)]
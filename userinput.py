@@ -1,49 +1,2372 @@
 # userinput.py
-import tkinter as tk
-from tkinter import messagebox, filedialog
-import customtkinter as ctk
+import argparse
+import base64
+import fnmatch
+import functools
+import hashlib
+import importlib.util
+import json
+import mimetypes
 import os
+import queue
+import shutil
+import stat
+import struct
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 
-try:
-    from PIL import Image, ImageTk
-    from PIL import ImageGrab
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
+# GUI toolkits and Pillow are imported on first use (see load_gui/load_pil), so the
+# headless --prompt/--file path never pays for them. Availability is checked without importing.
+tk = ctk = messagebox = filedialog = None
+Image = None
+PIL_AVAILABLE = importlib.util.find_spec("PIL") is not None
+DND_AVAILABLE = importlib.util.find_spec("tkinterdnd2") is not None
 
-try:
-    from tkinterdnd2 import DND_FILES, TkinterDnD
-    DND_AVAILABLE = True
-except ImportError:
-    DND_AVAILABLE = False
+
+def load_gui():
+    """Import tkinter and customtkinter into module globals"""
+    global tk, ctk, messagebox, filedialog
+    if ctk is None:
+        import tkinter as tk
+        from tkinter import messagebox, filedialog
+        import customtkinter as ctk
+
+
+def load_pil():
+    """Import PIL.Image into module globals; returns False if Pillow isn't installed"""
+    global Image
+    if Image is None:
+        try:
+            from PIL import Image as pil_image
+        except ImportError:
+            return False
+        Image = pil_image
+    return True
+
+
+IMAGE_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp']
+THUMBNAIL_SIZE = (80, 80)
+THUMBNAIL_MEMORY_BUDGET = 32 * 1024 * 1024  # decoded thumbnails kept in memory
+THUMBNAIL_DISK_BUDGET = 64 * 1024 * 1024    # encoded thumbnails kept on disk across sessions
+UI_POLL_MS = 25        # how often worker results are handed back to the main loop
+UI_POLL_BUDGET = 0.008  # max seconds of queued UI work per poll tick
+
+# Storage formats for pasted screenshots: file extension and Pillow save options.
+# "memory" keeps the image in memory and only spills it to disk (as fast PNG) on submit.
+SCREENSHOT_FORMATS = {
+    "png": (".png", {"format": "PNG", "compress_level": 1}),
+    "webp": (".webp", {"format": "WEBP", "lossless": True, "method": 0}),
+    "memory": (".png", {"format": "PNG", "compress_level": 1}),
+}
+DEFAULT_SCREENSHOT_FORMAT = os.environ.get("USERINPUT_SCREENSHOT_FORMAT", "png")
+SCREENSHOT_MAX_BYTES = 512 * 1024 * 1024    # unreferenced screenshots beyond this total are evicted
+SCREENSHOT_MAX_AGE = 7 * 24 * 60 * 60       # ...as are ones older than this many seconds
+UNWRITTEN_SCREENSHOT_GRACE = 60             # seconds before an unwritten screenshot entry is forgotten
+
+HASH_CHUNK_SIZE = 1024 * 1024           # streaming read size for content hashing
+HASH_SAMPLE_SIZE = 64 * 1024            # bytes read from each end for the cheap prefilter
+HASH_PREFILTER_MIN = 4 * 1024 * 1024    # files smaller than this are hashed whole straight away
+HASH_CACHE_MAX_ENTRIES = 20000
+
+# Upload-ready re-encodes of attached images: file extension and Pillow save options
+PREPROCESS_FORMATS = {
+    "jpeg": (".jpg", {"format": "JPEG", "optimize": True, "progressive": True}),
+    "webp": (".webp", {"format": "WEBP", "method": 4}),
+    "png": (".png", {"format": "PNG", "optimize": True}),
+}
+PREPROCESS_FORMAT = "webp"
+PREPROCESS_MAX_EDGE = 2048               # longest side, in pixels, of an optimized image
+PREPROCESS_QUALITY = 85                  # jpeg/webp quality
+PREPROCESS_DISK_BUDGET = 256 * 1024 * 1024  # optimized images kept on disk across sessions
+PREPROCESS_SUBMIT_WAIT = 5.0             # seconds submit waits for unfinished optimizations
+
+OUTPUT_FORMATS = ("text", "json", "ndjson")
+INLINE_CHUNK_SIZE = 3 * 64 * 1024  # multiple of 3 so each chunk base64-encodes without padding
+
+BUNDLE_FORMATS = ("tar", "zip")
+BUNDLE_COMPRESSION = ("auto", "gzip", "zstd", "none")
+BUNDLE_CHUNK_SIZE = 1024 * 1024         # buffer for copies the kernel can't do for us
+BUNDLE_SPOOL_MAX = 16 * 1024 * 1024     # compressed members larger than this are spooled to a temp file
+BUNDLE_COMPRESS_MIN = 1024              # smaller files aren't worth compressing
+# Types that compress well; media and archives are already compressed and are stored as-is
+BUNDLE_COMPRESSIBLE_EXTENSIONS = {'.txt', '.log', '.md', '.rst', '.csv', '.tsv', '.json', '.jsonl', '.ndjson',
+                                  '.xml', '.html', '.svg', '.yaml', '.yml', '.toml', '.ini', '.sql', '.rtf',
+                                  '.doc', '.xls', '.ppt', '.bmp', '.tiff', '.wav', '.py', '.js', '.ts', '.c',
+                                  '.h', '.cpp', '.java', '.go', '.rs', '.rb', '.sh'}
+
+PASTE_CHUNK_CHARS = 16 * 1024          # characters inserted per step of a large paste
+PASTE_STEP_BUDGET = 0.010              # seconds of insertion per idle callback
+PASTE_ATTACH_THRESHOLD = 200 * 1000    # pastes this long are offered as a text attachment (0 = never)
+
+FOLDER_EXCLUDE = (".git", ".hg", ".svn", "node_modules", "__pycache__", ".venv", ".DS_Store", "Thumbs.db")
+FOLDER_MAX_FILES = 10000                  # files attached from one dropped folder at most...
+FOLDER_MAX_BYTES = 2 * 1024 * 1024 * 1024  # ...and bytes
+FOLDER_BATCH_SIZE = 256                   # scanned files handed to the UI at once...
+FOLDER_BATCH_INTERVAL = 0.1               # ...or after this many seconds, whichever comes first
+
+PREVIEW_HEAD_BYTES = 64 * 1024          # bytes read from the start of a file to preview it
+PREVIEW_LINES = 2                       # lines of text shown under a text attachment's name
+PREVIEW_LINE_CHARS = 90
+PREVIEW_ZIP_DIRECTORY_MAX = 1024 * 1024  # larger zip directories only get an entry count
+PREVIEW_CACHE_MAX_ENTRIES = 5000
+PREVIEW_TABLE_EXTENSIONS = {'.csv', '.tsv'}
+# Leading bytes that identify a type regardless of the file's extension
+MAGIC_SIGNATURES = (
+    (b"%PDF-", "pdf"),
+    (b"PK\x03\x04", "zip"),
+    (b"PK\x05\x06", "zip"),
+    (b"\x89PNG\r\n\x1a\n", "image"),
+    (b"\xff\xd8\xff", "image"),
+    (b"GIF87a", "image"),
+    (b"GIF89a", "image"),
+    (b"II*\x00", "image"),
+    (b"MM\x00*", "image"),
+    (b"\x1f\x8b", "gzip"),
+    (b"7z\xbc\xaf\x27\x1c", "7z"),
+    (b"Rar!\x1a\x07", "rar"),
+)
+BMP_HEADER_SIZES = {12, 40, 52, 56, 64, 108, 124}  # BITMAPCOREHEADER ... BITMAPV5HEADER, OS/2 2.x
+KIND_ICONS = {"pdf": "📄", "zip": "📦", "image": "🖼️", "gzip": "📦", "7z": "📦", "rar": "📦", "text": "📃", "table": "📊"}
+
+CLIPBOARD_POLL_MIN = 0.25   # seconds between clipboard checks right after a change
+CLIPBOARD_POLL_MAX = 2.0    # checks back off to this interval while the clipboard is idle
+
+DRAFT_DEBOUNCE_MS = 500        # edits are journaled this long after the last one...
+DRAFT_MAX_DELAY = 2.0          # ...but no later than this many seconds after the first
+DRAFT_COMPACT_RECORDS = 500    # the journal is rewritten as one snapshot after this many records
+
+SERVER_SOCKET_NAME = "userinput.sock"  # in $XDG_RUNTIME_DIR, else the cache directory
+
+MONITOR_HEARTBEAT_MS = 20          # main-loop heartbeat used to detect stalls
+MONITOR_SAMPLE_INTERVAL = 0.01     # how often the watchdog samples the main thread during a stall
+MONITOR_MAX_EVENTS = 200000        # trace events kept in memory; later ones are dropped
+
+
+def log(message):
+    """Diagnostics go to stderr so stdout stays reserved for the submitted prompt"""
+    print(f"[userinput] {message}", file=sys.stderr, flush=True)
+
+
+def get_cache_dir(*parts):
+    """Per-user cache directory (override with USERINPUT_CACHE_DIR)"""
+    base = os.environ.get("USERINPUT_CACHE_DIR")
+    if not base:
+        if os.name == "nt":
+            base = os.path.join(os.environ.get("LOCALAPPDATA") or os.path.expanduser("~"), "userinput", "Cache")
+        else:
+            base = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache"), "userinput")
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def env_number(name):
+    """Numeric value of environment variable name, or None if it is unset or not a number"""
+    value = os.environ.get(name)
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        log(f"Ignoring {name}={value!r}: not a number")
+        return None
+
+
+def file_cache_key(filepath, st=None):
+    """Cache key that changes whenever the file is replaced or modified"""
+    if st is None:
+        st = os.stat(filepath)
+    return (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+
+
+def load_thumbnail(filepath, size=THUMBNAIL_SIZE):
+    """Decode a thumbnail-sized copy of an image (runs on a worker thread)"""
+    load_pil()
+    img = Image.open(filepath)
+    source_size = img.size
+    # JPEG can decode straight at 1/2, 1/4 or 1/8 scale; keep 2x headroom for LANCZOS
+    img.draft("RGB", (size[0] * 2, size[1] * 2))
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    img.info["source_size"] = "%dx%d" % source_size
+    return img
+
+
+def thumbnail_from_image(image, size=THUMBNAIL_SIZE):
+    """Downscale an in-memory image without copying it first (runs on a worker thread)"""
+    load_pil()
+    scale = min(size[0] / image.width, size[1] / image.height, 1.0)
+    thumb_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    img = image.resize(thumb_size, Image.Resampling.LANCZOS, reducing_gap=2.0)
+    if img.mode not in ("RGB", "RGBA", "L"):
+        img = img.convert("RGBA")
+    img.info["source_size"] = "%dx%d" % image.size
+    return img
+
+
+def source_dimensions(thumbnail):
+    """(width, height) of the image a thumbnail was made from, if recorded"""
+    try:
+        width, height = thumbnail.info["source_size"].split("x")
+        return int(width), int(height)
+    except (KeyError, ValueError, AttributeError):
+        return None
+
+
+def image_dimensions(filepath):
+    """(width, height) read from an image file's header, without decoding its pixels"""
+    if not load_pil():
+        return None
+    try:
+        with Image.open(filepath) as img:
+            return img.size
+    except Exception:
+        return None
+
+
+def save_screenshot(image, filepath, screenshot_format):
+    """Encode a pasted image to filepath atomically and return its stat (runs on a worker thread)"""
+    _, options = SCREENSHOT_FORMATS[screenshot_format]
+    tmp_path = filepath + ".part"
+    image.save(tmp_path, **options)
+    os.replace(tmp_path, filepath)
+    return os.stat(filepath)
+
+
+def preprocess_image(filepath, directory, max_edge, fmt, quality, digest=None):
+    """Downscale and re-encode an image for upload (runs in a worker process).
+
+    Outputs are cached in directory by the source's content digest, so an
+    image seen before is never decoded again. Returns (digest, path, size);
+    path is None when re-encoding would not make the file any smaller.
+    """
+    if digest is None:
+        digest = hash_file(filepath)
+    extension, options = PREPROCESS_FORMATS[fmt]
+    name = hashlib.blake2b(f"{digest}:{max_edge}:{quality}".encode("utf-8"), digest_size=16).hexdigest()
+    path = os.path.join(directory, name + extension)
+    try:
+        size = os.stat(path).st_size
+        os.utime(path)  # trim_directory evicts least-recently-used by mtime
+        return digest, (path if size else None), size
+    except FileNotFoundError:
+        pass
+
+    load_pil()
+    from PIL import ImageOps
+    tmp_path = f"{path}.{os.getpid()}.part"
+    with Image.open(filepath) as img:
+        if getattr(img, "n_frames", 1) > 1:
+            img = None  # re-encoding would drop the animation
+        else:
+            # JPEG can decode straight at a reduced scale; draft never goes below the requested size
+            img.draft("RGB", (max_edge, max_edge))
+            img = ImageOps.exif_transpose(img)
+            img.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            has_alpha = "A" in img.getbands() or "transparency" in img.info
+            if fmt == "jpeg" and img.mode not in ("RGB", "L"):
+                if has_alpha:
+                    img = img.convert("RGBA")
+                    flattened = Image.new("RGB", img.size, "white")
+                    flattened.paste(img, mask=img.getchannel("A"))
+                    img = flattened
+                else:
+                    img = img.convert("RGB")
+            elif img.mode not in ("RGB", "RGBA", "L", "LA", "P"):
+                img = img.convert("RGBA" if has_alpha else "RGB")
+            save_options = dict(options)
+            if fmt != "png":
+                save_options["quality"] = quality
+            img.save(tmp_path, **save_options)
+
+    if img is None or os.path.getsize(tmp_path) >= os.path.getsize(filepath):
+        # An empty file records "keep the original", so the decode isn't repeated either
+        open(tmp_path, "wb").close()
+    os.replace(tmp_path, path)
+    size = os.path.getsize(path)
+    return digest, (path if size else None), size
+
+
+def trim_directory(directory, budget):
+    """Delete the least-recently-used files in directory until it is within 80% of budget"""
+    try:
+        with os.scandir(directory) as entries:
+            files = sorted((e.stat().st_mtime, e.stat().st_size, e.path) for e in entries if e.is_file())
+    except OSError:
+        return
+    total = sum(size for _, size, _ in files)
+    if total <= budget:
+        return
+    for _, size, path in files:
+        if total <= budget * 0.8:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+
+def sniff_kind(head):
+    """Type of a file from its first bytes: a MAGIC_SIGNATURES kind, "text", or None"""
+    for signature, kind in MAGIC_SIGNATURES:
+        if head.startswith(signature):
+            return kind
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image"
+    # "BM" alone starts plenty of text files; a BMP also has a known DIB header size at offset 14
+    if head[:2] == b"BM" and len(head) >= 18 and struct.unpack_from("<I", head, 14)[0] in BMP_HEADER_SIZES:
+        return "image"
+    return "text" if decode_text_head(head) is not None else None
+
+
+def decode_text_head(head):
+    """Decode the start of a file as UTF-8 text, or return None if it looks binary"""
+    if b"\x00" in head:
+        return None
+    try:
+        return head.decode("utf-8-sig")
+    except UnicodeDecodeError as e:
+        # The read may have cut a multi-byte character in half
+        if e.start < len(head) - 3:
+            return None
+        return head[:e.start].decode("utf-8-sig")
+
+
+@functools.lru_cache(maxsize=None)
+def pdf_renderer():
+    """Name of an installed PDF rendering module, or None"""
+    for name in ("pypdfium2", "fitz"):
+        if importlib.util.find_spec(name) is not None:
+            return name
+    return None
+
+
+_pdf_lock = threading.Lock()  # neither renderer may be used from two threads at once
+
+
+def render_pdf(filepath, size=THUMBNAIL_SIZE):
+    """(page count, first page thumbnail) using whichever renderer is installed"""
+    load_pil()
+    with _pdf_lock:
+        if pdf_renderer() == "pypdfium2":
+            import pypdfium2
+            pdf = pypdfium2.PdfDocument(filepath)
+            try:
+                pages = len(pdf)
+                page = pdf[0]
+                scale = 2 * max(size) / max(page.get_width(), page.get_height())
+                img = page.render(scale=scale).to_pil()
+            finally:
+                pdf.close()
+        else:
+            import fitz
+            with fitz.open(filepath) as doc:
+                pages = doc.page_count
+                page = doc[0]
+                zoom = 2 * max(size) / max(page.rect.width, page.rect.height)
+                pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+                img = Image.frombytes("RGB", (pixmap.width, pixmap.height), pixmap.samples)
+    img.thumbnail(size, Image.Resampling.LANCZOS)
+    return pages, img
+
+
+def pdf_page_count(head, tail):
+    """Page count from the page tree root, if it lies in the bytes read (compressed object streams hide it)"""
+    import re
+    counts = [int(match) for chunk in (head, tail)
+              for match in re.findall(rb"/Type\s*/Pages\b[^>]*?/Count\s+(\d+)", chunk)
+              + re.findall(rb"/Count\s+(\d+)[^>]*?/Type\s*/Pages\b", chunk)]
+    return max(counts) if counts else None
+
+
+def zip_summary(f, size):
+    """(entries, total uncompressed bytes or None) from a zip's central directory, without reading members"""
+    tail_size = min(size, 65536 + 22)
+    f.seek(size - tail_size)
+    tail = f.read(tail_size)
+    end = tail.rfind(b"PK\x05\x06")
+    if end < 0 or end + 22 > len(tail):
+        return None
+    entries, directory_size = struct.unpack_from("<HI", tail, end + 10)
+    if entries == 0xFFFF or directory_size > PREVIEW_ZIP_DIRECTORY_MAX:
+        return (None if entries == 0xFFFF else entries), None  # Zip64, or too big to read
+    import zipfile
+    f.seek(0)
+    with zipfile.ZipFile(f) as archive:
+        infos = archive.infolist()
+    return len(infos), sum(info.file_size for info in infos)
+
+
+def shorten(line, limit=PREVIEW_LINE_CHARS):
+    line = line.expandtabs(4).strip()
+    return line if len(line) <= limit else line[:limit - 1] + "…"
+
+
+def load_preview(filepath):
+    """Describe a non-image file from a bounded read of its head (runs on a worker thread).
+
+    Returns {"kind", "text", "image"}; kind is sniffed from the leading
+    bytes (see sniff_kind), and image is a first-page thumbnail for PDFs when
+    a renderer is installed.
+    """
+    ext = os.path.splitext(filepath)[1].lower()
+    with open(filepath, "rb") as f:
+        head = f.read(PREVIEW_HEAD_BYTES)
+        size = os.fstat(f.fileno()).st_size
+        if not head:
+            return {"kind": None, "text": "Empty file", "image": None}
+
+        # The content decides, so a mislabelled file is still described correctly
+        kind = sniff_kind(head)
+        if kind == "text" and ext in PREVIEW_TABLE_EXTENSIONS:
+            kind = "table"
+
+        preview = {"kind": kind, "text": "", "image": None}
+        if kind in ("text", "table"):
+            text = decode_text_head(head) or ""
+            if len(head) < size and "\n" in text:
+                text = text[:text.rindex("\n")]  # drop the partial last line
+            lines = [line for line in text.splitlines() if line.strip()][:PREVIEW_LINES]
+            if kind == "table" and lines:
+                import csv
+                try:
+                    delimiter = csv.Sniffer().sniff(text[:8192], delimiters=",;\t|").delimiter
+                except csv.Error:
+                    delimiter = "\t" if ext == ".tsv" else ","
+                columns = next(csv.reader([lines[0]], delimiter=delimiter))
+                lines = [f"{len(columns)} columns: {', '.join(c.strip() for c in columns)}"] + lines[1:]
+            preview["text"] = "\n".join(shorten(line) for line in lines)
+        elif kind == "zip":
+            summary = zip_summary(f, size)
+            if summary is not None:
+                entries, total = summary
+                parts = [f"{entries:,} entries" if entries is not None else "ZIP64 archive"]
+                if total is not None:
+                    parts.append(f"{format_size(total)} uncompressed")
+                preview["text"] = " · ".join(parts)
+        elif kind == "pdf":
+            f.seek(max(0, size - PREVIEW_HEAD_BYTES))
+            pages = pdf_page_count(head, f.read(PREVIEW_HEAD_BYTES))
+            if pdf_renderer() is not None and PIL_AVAILABLE:
+                try:
+                    pages, preview["image"] = render_pdf(filepath)
+                except Exception:
+                    pass
+            if pages is not None:
+                preview["text"] = f"{pages:,} page{'s' if pages != 1 else ''}"
+    return preview
+
+
+class PreviewCache:
+    """In-memory (path, mtime, size) -> preview LRU, shared with the worker threads"""
+
+    def __init__(self, max_entries=PREVIEW_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._previews = OrderedDict()
+
+    def peek(self, key):
+        with self._lock:
+            preview = self._previews.get(key)
+            if preview is not None:
+                self._previews.move_to_end(key)
+            return preview
+
+    def put(self, key, preview):
+        with self._lock:
+            self._previews[key] = preview
+            self._previews.move_to_end(key)
+            while len(self._previews) > self.max_entries:
+                self._previews.popitem(last=False)
+
+
+def load_cached_preview(cache, filepath, key):
+    """Return (cache key, preview), reading the file only on a cache miss"""
+    preview = cache.peek(key)
+    if preview is None:
+        preview = load_preview(filepath)
+        cache.put(key, preview)
+    return key, preview
+
+
+class ThumbnailCache:
+    """Two-tier thumbnail cache: an in-memory LRU of decoded images with a byte
+    budget, backed by a size-capped directory of small PNGs that survives
+    across sessions. Safe to use from worker threads.
+    """
+
+    def __init__(self, directory, memory_budget=THUMBNAIL_MEMORY_BUDGET, disk_budget=THUMBNAIL_DISK_BUDGET):
+        self.directory = directory
+        self.memory_budget = memory_budget
+        self.disk_budget = disk_budget
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_lock = threading.Lock()
+        self._disk_bytes = None  # measured on the first write
+
+    def _disk_path(self, key):
+        name = hashlib.blake2b(repr(key).encode("utf-8"), digest_size=16).hexdigest()
+        return os.path.join(self.directory, name + ".png")
+
+    @staticmethod
+    def _nbytes(img):
+        return img.width * img.height * len(img.getbands())
+
+    def peek(self, key):
+        """Memory-only lookup, cheap enough for the UI thread"""
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+            return img
+
+    def get(self, key):
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                return img
+
+        path = self._disk_path(key)
+        load_pil()
+        try:
+            img = Image.open(path)
+            img.load()
+            os.utime(path)  # disk eviction is least-recently-used by mtime
+        except OSError:
+            return None
+        self._remember(key, img)
+        return img
+
+    def put(self, key, img):
+        self._remember(key, img)
+        path = self._disk_path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            from PIL.PngImagePlugin import PngInfo
+            pnginfo = PngInfo()
+            if "source_size" in img.info:
+                pnginfo.add_text("source_size", img.info["source_size"])
+            img.save(tmp_path, "PNG", pnginfo=pnginfo)
+            os.replace(tmp_path, path)
+            self._account_disk(os.path.getsize(path))
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+
+    def release_all(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+    def release(self, key):
+        """Drop a decoded thumbnail from memory (the disk copy is kept)"""
+        with self._lock:
+            img = self._memory.pop(key, None)
+            if img is not None:
+                self._memory_bytes -= self._nbytes(img)
+
+    def _remember(self, key, img):
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_bytes -= self._nbytes(old)
+            self._memory[key] = img
+            self._memory_bytes += self._nbytes(img)
+            while self._memory_bytes > self.memory_budget and len(self._memory) > 1:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= self._nbytes(evicted)
+
+    def _account_disk(self, added):
+        with self._disk_lock:
+            if self._disk_bytes is None:
+                self._disk_bytes = sum(entry.stat().st_size for entry in self._disk_entries())
+            else:
+                self._disk_bytes += added
+            if self._disk_bytes > self.disk_budget:
+                self._evict_disk()
+
+    def _disk_entries(self):
+        with os.scandir(self.directory) as entries:
+            return [entry for entry in entries if entry.name.endswith(".png") and entry.is_file()]
+
+    def _evict_disk(self):
+        # Trim to 80% of the budget so eviction doesn't run on every write
+        entries = sorted(((e.stat().st_mtime, e.stat().st_size, e.path) for e in self._disk_entries()))
+        total = sum(size for _, size, _ in entries)
+        target = self.disk_budget * 0.8
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self._disk_bytes = total
+
+
+def load_cached_thumbnail(cache, filepath, key=None):
+    """Return (cache key, thumbnail), decoding only on a cache miss"""
+    if key is None:
+        key = file_cache_key(filepath)
+    if cache is not None:
+        img = cache.get(key)
+        if img is not None:
+            return key, img
+    img = load_thumbnail(filepath)
+    if cache is not None:
+        cache.put(key, img)
+    return key, img
+
+
+class ScreenshotStore:
+    """Directory of pasted screenshots owned by this tool.
+
+    A manifest records every file the store created, so nothing ever lists
+    the directory. Files referenced by attached_files are never evicted.
+    Unreferenced files are deleted by a background thread once they pass the
+    age or total-size cap, or as soon as possible if they were discarded in
+    this session without being submitted.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, directory, max_bytes=SCREENSHOT_MAX_BYTES, max_age=SCREENSHOT_MAX_AGE):
+        self.directory = os.path.abspath(directory)
+        os.makedirs(self.directory, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        self._entries = {}       # filename -> {"size": bytes, "created": epoch seconds}
+        self._refs = set()       # filenames currently attached
+        self._discarded = set()  # filenames dropped this session without being submitted
+        self._dirty = False
+        self._stopping = False
+        self._wake = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="screenshot-gc", daemon=True)
+        self._thread.start()
+
+    def new_path(self, extension, prefix="pasted_image"):
+        """Allocate (and start tracking) a path for a new screenshot or other pasted content"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
+        filename = f"{prefix}_{timestamp}{extension}"
+        with self._lock:
+            self._entries[filename] = {"size": 0, "created": time.time()}
+            self._refs.add(filename)
+            self._dirty = True
+        return os.path.join(self.directory, filename)
+
+    def _name(self, filepath):
+        if os.path.dirname(os.path.abspath(filepath)) != self.directory:
+            return None
+        return os.path.basename(filepath)
+
+    def owns(self, filepath):
+        name = self._name(filepath)
+        with self._lock:
+            return name is not None and name in self._entries
+
+    def update(self, filepath, size):
+        """Record a screenshot's size once it has been written"""
+        name = self._name(filepath)
+        if name is None:
+            return
+        with self._lock:
+            entry = self._entries.setdefault(name, {"size": 0, "created": time.time()})
+            entry["size"] = size
+            self._dirty = True
+        self._wake.set()
+
+    def retain(self, filepath):
+        name = self._name(filepath)
+        with self._lock:
+            # A restored draft may retain files before the manifest has been loaded
+            if name is not None:
+                self._refs.add(name)
+                self._discarded.discard(name)
+
+    def release(self, filepath):
+        """Drop an attachment's reference; unsubmitted screenshots are deleted in the background"""
+        name = self._name(filepath)
+        with self._lock:
+            if name in self._refs:
+                self._refs.discard(name)
+                self._discarded.add(name)
+        self._wake.set()
+
+    def release_all(self):
+        with self._lock:
+            self._discarded |= self._refs
+            self._refs.clear()
+        self._wake.set()
+
+    def commit(self, filepaths):
+        """Mark screenshots as handed out, so only the age/size caps may evict them"""
+        with self._lock:
+            for filepath in filepaths:
+                name = self._name(filepath)
+                self._discarded.discard(name)
+                # A resident window clears its attachments next; that must not discard these
+                self._refs.discard(name)
+
+    def close(self):
+        with self._lock:
+            self._stopping = True
+        self._wake.set()
+        self._thread.join(timeout=2)
+
+    def _run(self):
+        self._load_manifest()
+        while True:
+            self._collect()
+            self._save_manifest()
+            with self._lock:
+                if self._stopping:
+                    return
+            self._wake.wait()
+            self._wake.clear()
+
+    def _manifest_path(self):
+        return os.path.join(self.directory, self.MANIFEST)
+
+    def _load_manifest(self):
+        try:
+            with open(self._manifest_path(), encoding="utf-8") as f:
+                entries = json.load(f).get("entries", {})
+        except (OSError, ValueError, AttributeError):
+            return
+        with self._lock:
+            for name, entry in entries.items():
+                self._entries.setdefault(name, entry)
+
+    def _save_manifest(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"entries": dict(self._entries)}
+            self._dirty = False
+        tmp_path = self._manifest_path() + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self._manifest_path())
+        except OSError:
+            pass
+
+    def _collect(self):
+        now = time.time()
+        with self._lock:
+            candidates = sorted((entry["created"], name) for name, entry in self._entries.items()
+                                if name not in self._refs)
+            total = sum(entry["size"] for entry in self._entries.values())
+            victims = []
+            for created, name in candidates:
+                size = self._entries[name]["size"]
+                if not size and now - created < UNWRITTEN_SCREENSHOT_GRACE:
+                    continue  # may still be being encoded
+                if name in self._discarded or now - created > self.max_age or total > self.max_bytes:
+                    victims.append(name)
+                    total -= size
+        for name in victims:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                continue
+            with self._lock:
+                if name not in self._refs:
+                    self._entries.pop(name, None)
+                    self._discarded.discard(name)
+                    self._dirty = True
+
+
+def write_file_atomic(filepath, data, fsync=False):
+    """Write bytes to filepath via a temporary file and return its stat (runs on a worker thread)"""
+    tmp_path = filepath + ".part"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+    os.replace(tmp_path, filepath)
+    return os.stat(filepath)
+
+
+def hash_file(filepath, chunk_size=HASH_CHUNK_SIZE):
+    """BLAKE2b digest of a file, streamed through one reusable buffer"""
+    digest = hashlib.blake2b(digest_size=32)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(filepath, "rb", buffering=0) as f:
+        while True:
+            n = f.readinto(buffer)
+            if not n:
+                break
+            digest.update(view[:n])
+    return digest.hexdigest()
+
+
+def sample_file(filepath, size, sample_size=HASH_SAMPLE_SIZE):
+    """Digest of a file's size plus its first and last sample_size bytes"""
+    digest = hashlib.blake2b(str(size).encode("ascii"), digest_size=16)
+    with open(filepath, "rb") as f:
+        digest.update(f.read(sample_size))
+        if size > sample_size:
+            f.seek(max(sample_size, size - sample_size))
+            digest.update(f.read(sample_size))
+    return digest.hexdigest()
+
+
+def hash_image(image, strip_rows=256):
+    """Digest of an in-memory image's pixels, converted a strip at a time"""
+    digest = hashlib.blake2b(f"{image.mode}:{image.width}x{image.height}".encode("ascii"), digest_size=32)
+    for top in range(0, image.height, strip_rows):
+        digest.update(image.crop((0, top, image.width, min(top + strip_rows, image.height))).tobytes())
+    return "img:" + digest.hexdigest()
+
+
+class HashCache:
+    """Persistent (path, mtime, size) -> content digest map, plus in-memory
+    head/tail samples. Loaded and saved off the UI thread.
+    """
+
+    def __init__(self, filepath, max_entries=HASH_CACHE_MAX_ENTRIES):
+        self.filepath = filepath
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._digests = OrderedDict()
+        self._samples = {}
+        self._dirty = False
+        self._loaded = threading.Event()
+
+    @staticmethod
+    def _key(cache_key):
+        return "\0".join(str(part) for part in cache_key)
+
+    def load(self):
+        try:
+            with open(self.filepath, encoding="utf-8") as f:
+                stored = json.load(f)
+            with self._lock:
+                for key, digest in stored.items():
+                    self._digests.setdefault(key, digest)
+        except (OSError, ValueError, AttributeError):
+            pass
+        finally:
+            self._loaded.set()
+
+    def peek(self, cache_key):
+        """Non-blocking lookup for the UI thread (misses until the cache has loaded)"""
+        with self._lock:
+            return self._digests.get(self._key(cache_key))
+
+    def get(self, cache_key):
+        self._loaded.wait()
+        return self.peek(cache_key)
+
+    def put(self, cache_key, digest):
+        with self._lock:
+            self._digests[self._key(cache_key)] = digest
+            self._digests.move_to_end(self._key(cache_key))
+            while len(self._digests) > self.max_entries:
+                self._digests.popitem(last=False)
+            self._dirty = True
+
+    def sample(self, filepath, cache_key):
+        with self._lock:
+            sample = self._samples.get(cache_key)
+        if sample is None:
+            sample = sample_file(filepath, cache_key[2])
+            with self._lock:
+                self._samples[cache_key] = sample
+        return sample
+
+    def digest(self, filepath, cache_key):
+        digest = self.get(cache_key)
+        if digest is None:
+            digest = hash_file(filepath)
+            self.put(cache_key, digest)
+        return digest
+
+    def save(self):
+        with self._lock:
+            if not self._dirty:
+                return
+            data = dict(self._digests)
+            self._dirty = False
+        tmp_path = self.filepath + ".tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.filepath)
+        except OSError:
+            pass
+
+
+def find_duplicate_digests(cache, filepath, cache_key, peers):
+    """Digest filepath and whichever same-size peers it could be a copy of.
+
+    peers is a list of (path, cache_key) for attached files of the same size.
+    Large files are first compared by a head/tail sample, so the full hash is
+    only computed when a sample matches. Returns {path: digest}; filepath
+    maps to its cached digest (or None) when no peer can be a duplicate.
+    """
+    if cache_key[2] >= HASH_PREFILTER_MIN:
+        sample = cache.sample(filepath, cache_key)
+        peers = [(path, key) for path, key in peers if cache.sample(path, key) == sample]
+        if not peers:
+            return {filepath: cache.get(cache_key)}
+    digests = {filepath: cache.digest(filepath, cache_key)}
+    for path, key in peers:
+        try:
+            digests[path] = cache.digest(path, key)
+        except OSError:
+            pass
+    return digests
+
+
+class ContentHasher:
+    """Runs content hashing jobs on a small worker pool, delivering results on the UI thread"""
+
+    def __init__(self, deliver, cache, max_workers=2):
+        self._deliver = deliver
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hash")
+        self._executor.submit(cache.load)
+        self._jobs = {}
+
+    def request(self, key, callback, func, *args):
+        """Run func(*args) in the background and call callback(result) on the UI thread"""
+        self.cancel(key)
+        future = self._executor.submit(func, *args)
+        self._jobs[key] = future
+        future.add_done_callback(lambda f: self._deliver(self._finish, key, f, callback))
+
+    def _finish(self, key, future, callback):
+        if self._jobs.get(key) is not future:
+            return
+        del self._jobs[key]
+        try:
+            result = future.result()
+        except Exception:
+            result = None
+        callback(result)
+
+    def cancel(self, key):
+        future = self._jobs.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def busy(self):
+        return bool(self._jobs)
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self.cache.save()
+
+
+class ThumbnailLoader:
+    """Decodes image thumbnails on a bounded worker pool.
+
+    Results are handed back through ``deliver`` (which must run its callable on
+    the Tk main loop), because PhotoImage objects can only be created there.
+    """
+
+    def __init__(self, deliver, cache=None, max_workers=None):
+        self._deliver = deliver
+        self.cache = cache
+        self.previews = PreviewCache()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or min(4, os.cpu_count() or 1),
+                                            thread_name_prefix="thumbnail")
+        self._jobs = {}
+
+    def request(self, key, filepath, callback, cache_key=None):
+        """Load filepath's thumbnail in the background and call callback(cache_key, image) on the UI thread"""
+        self.cancel(key)
+        self._start(key, callback, load_cached_thumbnail, self.cache, filepath, cache_key)
+
+    def request_image(self, key, image, callback):
+        """Like request(), for an image that is only in memory (nothing is cached)"""
+        self._start(key, callback, lambda: (None, thumbnail_from_image(image)))
+
+    def request_preview(self, key, filepath, cache_key, callback):
+        """Like request(), for a non-image file's load_preview() description"""
+        self._start(key, callback, load_cached_preview, self.previews, filepath, cache_key)
+
+    def _start(self, key, callback, func, *args):
+        self.cancel(key)
+        future = self._executor.submit(func, *args)
+        self._jobs[key] = future
+        future.add_done_callback(lambda f: self._deliver(self._finish, key, f, callback))
+
+    def _finish(self, key, future, callback):
+        # A row removed (or re-requested) while decoding no longer wants this result
+        if self._jobs.get(key) is not future:
+            return
+        del self._jobs[key]
+        try:
+            cache_key, image = future.result()
+        except Exception:
+            cache_key, image = None, None
+        callback(cache_key, image)
+
+    def pending(self, key):
+        return key in self._jobs
+
+    def busy(self):
+        return bool(self._jobs)
+
+    def cancel(self, key):
+        future = self._jobs.pop(key, None)
+        if future is not None:
+            future.cancel()
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ImagePreprocessor:
+    """Prepares attached images for upload in a process pool.
+
+    Decoding, resizing and encoding a large photo holds the GIL for hundreds
+    of milliseconds, so it runs in separate processes rather than beside the
+    UI thread. Results are cached on disk by content digest.
+    """
+
+    def __init__(self, deliver, directory, max_edge=PREPROCESS_MAX_EDGE, fmt=PREPROCESS_FORMAT,
+                 quality=PREPROCESS_QUALITY, disk_budget=PREPROCESS_DISK_BUDGET, max_workers=None):
+        if fmt not in PREPROCESS_FORMATS:
+            raise ValueError(f"Unknown image format: {fmt}")
+        self._deliver = deliver
+        self.directory = directory
+        self.max_edge = max_edge
+        self.fmt = fmt
+        self.quality = quality
+        self.disk_budget = disk_budget
+        self.max_workers = max_workers or max(1, min(2, (os.cpu_count() or 1) - 1))
+        self._executor = None  # worker processes are only started once an image needs them
+        self._jobs = {}
+
+    def _pool(self):
+        if self._executor is None:
+            import multiprocessing
+            from concurrent.futures import ProcessPoolExecutor
+            # spawn rather than fork: this process has Tk and worker threads running
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 mp_context=multiprocessing.get_context("spawn"))
+            self._executor.submit(trim_directory, self.directory, self.disk_budget)
+        return self._executor
+
+    def request(self, key, filepath, callback, digest=None):
+        """Optimize filepath in the background and call callback(result) on the UI thread.
+
+        result is preprocess_image's (digest, path, size), or None on failure.
+        """
+        self.cancel(key)
+        future = self._pool().submit(preprocess_image, filepath, self.directory,
+                                     self.max_edge, self.fmt, self.quality, digest)
+        self._jobs[key] = (future, callback)
+        future.add_done_callback(lambda f: self._deliver(self._finish, key, f))
+
+    def _finish(self, key, future):
+        job = self._jobs.get(key)
+        if job is None or job[0] is not future:
+            return
+        del self._jobs[key]
+        try:
+            result = future.result()
+        except Exception as e:
+            log(f"Could not optimize {key}: {e}")
+            result = None
+        job[1](result)
+
+    def wait(self, timeout):
+        """Finish outstanding jobs on the calling (UI) thread, giving up after timeout seconds"""
+        deadline = time.monotonic() + timeout
+        for key, (future, _) in list(self._jobs.items()):
+            try:
+                future.result(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                pass
+            if future.done():
+                self._finish(key, future)
+
+    def busy(self):
+        return bool(self._jobs)
+
+    def cancel(self, key):
+        job = self._jobs.pop(key, None)
+        if job is not None:
+            job[0].cancel()
+
+    def cancel_all(self):
+        for key in list(self._jobs):
+            self.cancel(key)
+
+    def shutdown(self):
+        self.cancel_all()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def preprocess_attachments(attachments, max_edge=PREPROCESS_MAX_EDGE, fmt=PREPROCESS_FORMAT,
+                           quality=PREPROCESS_QUALITY):
+    """Optimize the image attachments in a process pool and wait for them (headless mode)"""
+    images = [item for item in attachments
+              if item.size is not None and os.path.splitext(item.path)[1].lower() in IMAGE_EXTENSIONS]
+    if not images:
+        return
+    from concurrent.futures import ProcessPoolExecutor
+    directory = get_cache_dir("optimized")
+    with ProcessPoolExecutor(max_workers=min(len(images), os.cpu_count() or 1)) as executor:
+        futures = [(item, executor.submit(preprocess_image, item.path, directory, max_edge, fmt, quality))
+                   for item in images]
+        for item, future in futures:
+            try:
+                item.set_optimized(*future.result()[1:])
+            except Exception as e:
+                log(f"Could not optimize {item.name}: {e}")
+    trim_directory(directory, PREPROCESS_DISK_BUDGET)
+
+
+def format_size(size):
+    return f"{size / 1024:.1f} KB" if size < 1024 * 1024 else f"{size / (1024 * 1024):.1f} MB"
+
+
+class Attachment:
+    """Backing record for one attached file, captured once at attach time"""
+
+    __slots__ = ("path", "name", "size", "mtime", "icon", "is_image", "cache_key", "image", "digest", "status",
+                 "dimensions", "optimized_path", "optimized_size", "preview")
+
+    def __init__(self, path, name, st=None, icon="📁", is_image=False):
+        self.path = path
+        self.name = name
+        self.size = st.st_size if st is not None else None
+        self.mtime = st.st_mtime if st is not None else None
+        self.icon = icon
+        self.is_image = is_image
+        self.cache_key = file_cache_key(path, st) if st is not None else None
+        self.image = None  # in-memory image not yet (or never) written to path
+        self.digest = None  # content digest, when known
+        self.status = ""    # transient state shown in the row, e.g. "hashing…"
+        self.dimensions = None  # (width, height) for images, once known
+        self.optimized_path = None  # upload-ready re-encode, see preprocess_image
+        self.optimized_size = None
+        self.preview = None  # load_preview() result for non-image files, once a row has shown it
+
+    def update_stat(self, st):
+        self.size = st.st_size
+        self.mtime = st.st_mtime
+        self.cache_key = file_cache_key(self.path, st)
+
+    def set_optimized(self, path, size):
+        self.optimized_path = path
+        self.optimized_size = size if path is not None else None
+
+    @property
+    def saved_bytes(self):
+        if self.optimized_size is None or self.size is None:
+            return None
+        return self.size - self.optimized_size
+
+    @property
+    def size_text(self):
+        return format_size(self.size) if self.size is not None else ""
+
+    @property
+    def type_text(self):
+        return os.path.splitext(self.path)[1].upper() or "No extension"
+
+    def to_record(self):
+        """Machine-readable metadata, as captured at attach time"""
+        width, height = self.dimensions or (None, None)
+        return {
+            "path": self.path,
+            "name": self.name,
+            "exists": self.size is not None,
+            "size": self.size,
+            "mtime": self.mtime,
+            "type": os.path.splitext(self.path)[1].lower(),
+            "mime": mimetypes.guess_type(self.path)[0],
+            "width": width,
+            "height": height,
+            "digest": self.digest,
+            "optimized_path": self.optimized_path,
+            "optimized_size": self.optimized_size,
+            "saved_bytes": self.saved_bytes,
+        }
+
+    @classmethod
+    def from_record(cls, record):
+        """Rebuild an attachment from to_record() output, e.g. one received from a prompt server"""
+        item = cls(record["path"], record["name"])
+        item.size = record["size"]
+        item.mtime = record["mtime"]
+        if record["width"] is not None:
+            item.dimensions = (record["width"], record["height"])
+        item.digest = record["digest"]
+        item.set_optimized(record["optimized_path"], record["optimized_size"])
+        return item
+
+    @property
+    def preview_text(self):
+        return self.preview["text"] if self.preview is not None else ""
+
+    @property
+    def detail_text(self):
+        optimized = f"→ {format_size(self.optimized_size)}" if self.optimized_path else ""
+        return " · ".join(part for part in (self.size_text, optimized, self.status) if part)
+
+
+LIST_ROW_HEIGHT = 100  # pixels per attachment row, including the gap below it
+LIST_OVERSCAN = 2      # rows built beyond the viewport so small scrolls don't rebind
+
+
+class FileRow:
+    """One recyclable row of widgets in a VirtualFileList"""
+
+    def __init__(self, file_list):
+        self.item = None
+        self.photo = None
+        self.frame = ctk.CTkFrame(file_list.viewport, height=LIST_ROW_HEIGHT - 10)
+        self.frame.pack_propagate(False)
+
+        self.preview_label = ctk.CTkLabel(self.frame, text="", width=80, height=80, font=file_list.icon_font)
+        self.preview_label.pack(side="left", padx=10, pady=5)
+
+        info_frame = ctk.CTkFrame(self.frame, fg_color="transparent")
+        info_frame.pack(side="left", fill="x", expand=True, padx=10)
+
+        self.name_label = ctk.CTkLabel(info_frame, text="", font=file_list.name_font, anchor="w")
+        self.name_label.pack(fill="x", anchor="w")
+
+        self.size_label = ctk.CTkLabel(info_frame, text="",
+                                       font=file_list.detail_font,
+                                       text_color=("gray60", "gray40"),
+                                       anchor="w")
+        self.size_label.pack(fill="x", anchor="w")
+
+        self.summary_label = ctk.CTkLabel(info_frame, text="",
+                                          font=file_list.detail_font,
+                                          text_color=("gray50", "gray50"),
+                                          anchor="w",
+                                          justify="left")
+        self.summary_label.pack(fill="x", anchor="w")
+
+        self.remove_btn = ctk.CTkButton(self.frame, text="🗑️",
+                                        command=lambda: file_list.on_remove(self.item),
+                                        width=40,
+                                        height=40,
+                                        corner_radius=8,
+                                        fg_color=("#ef4444", "#dc2626"),
+                                        hover_color=("#dc2626", "#b91c1c"))
+        self.remove_btn.pack(side="right", padx=10)
+
+        for widget in (self.frame, self.preview_label, info_frame, self.name_label, self.size_label,
+                       self.summary_label):
+            file_list.bind_scroll(widget)
+
+    def bind(self, item):
+        self.item = item
+        self.photo = None
+        self.preview_label.configure(image="", text=item.icon)
+        self.name_label.configure(text=item.name)
+        self.size_label.configure(text=item.detail_text)
+        self.summary_label.configure(text=item.preview_text)
+        if item.preview is not None and item.preview["image"] is not None:
+            self.show_image(item.preview["image"])
+
+    def show_image(self, img):
+        from PIL import ImageTk
+        self.photo = ImageTk.PhotoImage(img)
+        self.preview_label.configure(image=self.photo, text="")
+
+
+class VirtualFileList:
+    """Scrollable attachment list that only builds widgets for the visible rows.
+
+    A fixed pool of FileRow widgets (viewport plus overscan) is placed over a
+    plain frame and rebound to different Attachment records as the view
+    scrolls, so attach, scroll and clear cost about the same for 10 or 10,000
+    files. ``items`` is the backing model; call refresh() after changing it.
+    """
+
+    def __init__(self, master, height, empty_text, on_remove, on_bind=None, on_unbind=None):
+        self.on_remove = on_remove
+        self.on_bind = on_bind
+        self.on_unbind = on_unbind
+        self.items = []
+        self.offset = 0
+        self.rows = []
+        self._drop_handler = None
+
+        # Fonts are shared by every row instead of being created per attachment
+        self.icon_font = ctk.CTkFont(size=24)
+        self.name_font = ctk.CTkFont(size=12, weight="bold")
+        self.detail_font = ctk.CTkFont(size=10)
+
+        self.frame = ctk.CTkFrame(master, height=height)
+        self.frame.pack_propagate(False)
+
+        self.scrollbar = ctk.CTkScrollbar(self.frame, command=self.yview)
+        self.scrollbar.pack(side="right", fill="y", padx=(0, 4), pady=4)
+
+        self.viewport = ctk.CTkFrame(self.frame, fg_color="transparent")
+        self.viewport.pack(side="left", fill="both", expand=True, padx=(4, 0), pady=4)
+        self.viewport.bind("<Configure>", lambda e: self.refresh())
+        self.bind_scroll(self.viewport)
+
+        self.empty_label = ctk.CTkLabel(self.viewport, text=empty_text,
+                                        font=ctk.CTkFont(size=11),
+                                        text_color=("gray60", "gray40"))
+        self.bind_scroll(self.empty_label)
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def enable_drop(self, drop_types, handler):
+        """Register the list (and every row built later) as a drag-and-drop target"""
+        self._drop_handler = (drop_types, handler)
+        for widget in (self.frame, self.viewport, self.empty_label):
+            self._register_drop(widget)
+        for row in self.rows:
+            self._register_drop(row.frame)
+
+    def _register_drop(self, widget):
+        if self._drop_handler is None:
+            return
+        drop_types, handler = self._drop_handler
+        try:
+            widget.drop_target_register(drop_types)
+            widget.dnd_bind('<<Drop>>', handler)
+        except Exception:
+            pass
+
+    def bind_scroll(self, widget):
+        widget.bind("<MouseWheel>", self._on_mousewheel, add="+")
+        widget.bind("<Button-4>", lambda e: self.scroll_by(-LIST_ROW_HEIGHT // 3), add="+")
+        widget.bind("<Button-5>", lambda e: self.scroll_by(LIST_ROW_HEIGHT // 3), add="+")
+
+    def _on_mousewheel(self, event):
+        # Windows reports multiples of 120, macOS small deltas
+        step = event.delta // 120 if abs(event.delta) >= 120 else event.delta
+        self.scroll_by(-step * (LIST_ROW_HEIGHT // 3))
+
+    def scroll_by(self, pixels):
+        self.offset += pixels
+        self.refresh()
+
+    def yview(self, *args):
+        """Scrollbar command: ('moveto', fraction) or ('scroll', n, 'units'|'pages')"""
+        view_height = max(self.viewport.winfo_height(), 1)
+        if args[0] == "moveto":
+            self.offset = int(float(args[1]) * len(self.items) * LIST_ROW_HEIGHT)
+        elif args[0] == "scroll":
+            step = view_height if args[2] == "pages" else LIST_ROW_HEIGHT // 3
+            self.offset += int(args[1]) * step
+        self.refresh()
+
+    def scroll_to_end(self):
+        self.offset = len(self.items) * LIST_ROW_HEIGHT
+        self.refresh()
+
+    def refresh(self):
+        """Re-place the row pool for the current model and scroll offset"""
+        view_height = max(self.viewport.winfo_height(), 1)
+        content_height = len(self.items) * LIST_ROW_HEIGHT
+        self.offset = max(0, min(self.offset, content_height - view_height))
+
+        if not self.items:
+            self.empty_label.place(relx=0.5, rely=0.5, anchor="center")
+        else:
+            self.empty_label.place_forget()
+
+        pool_size = min(len(self.items), view_height // LIST_ROW_HEIGHT + 1 + LIST_OVERSCAN)
+        while len(self.rows) < pool_size:
+            row = FileRow(self)
+            self._register_drop(row.frame)
+            self.rows.append(row)
+
+        # Rows are assigned by index modulo the pool size, so a row keeps its
+        # item for as long as that item stays within the rendered window
+        first = max(0, min(self.offset // LIST_ROW_HEIGHT - LIST_OVERSCAN // 2, len(self.items) - pool_size))
+        assigned = {index % pool_size: index for index in range(first, first + pool_size)}
+        # Unbind every row that changes item before binding any, so a row let go
+        # late can't cancel the thumbnail another row has just requested for its item
+        for slot, row in enumerate(self.rows):
+            index = assigned.get(slot)
+            if index is None or row.item is not self.items[index]:
+                self._unbind(row)
+                if index is None:
+                    row.frame.place_forget()
+        for slot, index in assigned.items():
+            row = self.rows[slot]
+            item = self.items[index]
+            if row.item is not item:
+                row.bind(item)
+                if self.on_bind is not None:
+                    self.on_bind(item)
+            row.frame.place(x=0, y=index * LIST_ROW_HEIGHT - self.offset, relwidth=1.0)
+
+        if content_height <= view_height:
+            self.scrollbar.set(0.0, 1.0)
+        else:
+            self.scrollbar.set(self.offset / content_height, (self.offset + view_height) / content_height)
+
+    def _unbind(self, row):
+        if row.item is not None and self.on_unbind is not None:
+            self.on_unbind(row.item)
+        row.item = None
+        row.photo = None
+
+    def refresh_item(self, item):
+        """Re-read item's text fields if it is currently bound to a row"""
+        for row in self.rows:
+            if row.item is item:
+                row.size_label.configure(text=item.detail_text)
+                row.summary_label.configure(text=item.preview_text)
+                return
+
+    def show_preview(self, item):
+        """Re-bind item's row (if any) after its icon or preview changed"""
+        for row in self.rows:
+            if row.item is item:
+                row.bind(item)
+                return
+
+    def show_thumbnail(self, item, img):
+        """Display a decoded thumbnail if item is currently bound to a row"""
+        for row in self.rows:
+            if row.item is item:
+                row.show_image(img)
+                return
+
+    def clear(self):
+        """Reset the row pool after the backing model has been emptied"""
+        for row in self.rows:
+            self._unbind(row)
+            row.frame.place_forget()
+        self.offset = 0
+        self.refresh()
+
+
+class TextChangeTracker:
+    """Observes every insert/delete on a tk Text widget.
+
+    The widget's Tcl command is renamed and replaced by a proxy (the same
+    technique as idlelib's WidgetRedirector), so changes from typing,
+    bindings and code are all seen as deltas. Character and line counts are
+    kept incrementally, and listeners get (op, index, text) with op
+    "insert", "delete" or "reset" (after undo/redo, when the whole text
+    should be re-read).
+    """
+
+    # Runs in place of the widget command. Only changes that succeeded are
+    # reported; errors (e.g. "get sel.first sel.last" with no selection, which
+    # Tk's copy/cut bindings rely on) reach the caller untouched.
+    PROXY = """
+    proc %(name)s {op args} {
+        if {$op ni {insert delete replace} || [catch {%(orig)s index [lindex $args 0]} index]} {
+            set result [%(orig)s $op {*}$args]
+            if {$op eq "edit" && [lindex $args 0] in {undo redo}} {
+                %(notify)s reset {} {}
+            }
+            return $result
+        }
+        set removed {}
+        if {$op ne "insert"} {
+            set end [expr {[llength $args] > 1 ? [lindex $args 1] : "$index+1c"}]
+            # delete never removes the final newline, even for "delete 1.0 end"
+            if {![catch {%(orig)s compare $end > end-1c} past] && $past} {
+                set end end-1c
+            }
+            catch {%(orig)s get $index $end} removed
+        }
+        set result [%(orig)s $op {*}$args]
+        %(notify)s $op $index $removed {*}$args
+        return $result
+    }
+    """
+
+    def __init__(self, text_widget):
+        self.widget = text_widget
+        self.listeners = []
+        self._tk = text_widget.tk
+        self._name = str(text_widget)
+        self._orig = self._name + "_orig"
+        self._tk.call("rename", self._name, self._orig)
+        self._tk.createcommand(self._name + "_notify", self._changed)
+        self._tk.eval(self.PROXY % {"name": self._name, "orig": self._orig, "notify": self._name + "_notify"})
+        self.recount()
+
+    def _call(self, *args):
+        return self._tk.call((self._orig,) + args)
+
+    def recount(self):
+        self.chars = int(self._call("count", "-chars", "1.0", "end-1c") or 0)
+        self.lines = int(self._call("count", "-lines", "1.0", "end-1c") or 0) + 1
+
+    def _notify(self, op, index, text):
+        for listener in self.listeners:
+            listener(op, index, text)
+
+    def _changed(self, op, index, removed, *args):
+        """Called by the proxy after an insert/delete/replace succeeded, or after undo/redo"""
+        try:
+            if op == "reset":
+                # Undo/redo change the text inside Tk without going through this command
+                self.recount()
+                self._notify("reset", None, None)
+                return
+            if removed:
+                self.chars -= len(removed)
+                self.lines -= removed.count("\n")
+                self._notify("delete", index, removed)
+            if op in ("insert", "replace"):
+                text = "".join(args[1::2] if op == "insert" else args[2::2])
+                self.chars += len(text)
+                self.lines += text.count("\n")
+                self._notify("insert", index, text)
+        except Exception:
+            # An exception here would surface later from mainloop, not to the caller
+            traceback.print_exc()
+
+    def text(self):
+        return self._call("get", "1.0", "end-1c")
+
+
+def lock_file(filepath):
+    """Open filepath and take a non-blocking exclusive lock on it.
+
+    Returns the open file, which holds the lock until it is closed (or the
+    process exits), or None if another process already holds it.
+    """
+    f = open(filepath, "a+b")
+    try:
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+def tk_columns(text):
+    """Length of text in Tk 8.6 index columns, which count a non-BMP character (e.g. an emoji) as two"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def text_offset(text, index):
+    """Offset in text of a Tk "line.column" index, clamped the way Tk clamps it"""
+    line, column = (int(part) for part in index.split("."))
+    start = 0
+    for _ in range(line - 1):
+        start = text.find("\n", start)
+        if start < 0:
+            return len(text)
+        start += 1
+    end = text.find("\n", start)
+    if end < 0:
+        end = len(text)
+    offset = min(start + column, end)
+    if tk_columns(text[start:offset]) == offset - start:
+        return offset  # no emoji before the index
+    offset = start
+    while column > 0 and offset < end:
+        column -= tk_columns(text[offset])
+        offset += 1
+    return offset
+
+
+def advance_index(index, text):
+    """The Tk index just past text inserted at index on the same line"""
+    line, column = index.split(".")
+    return f"{line}.{int(column) + tk_columns(text)}"
+
+
+def load_draft(filepath):
+    """Replay a draft journal; returns (text, {path: name}) or None if there is no draft"""
+    try:
+        f = open(filepath, encoding="utf-8")
+    except FileNotFoundError:
+        return None
+    text, files = "", {}
+    with f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                op = record["op"]
+                if op == "snapshot":
+                    text = record["text"]
+                    files = {entry["path"]: entry["name"] for entry in record["files"]}
+                elif op == "insert":
+                    offset = text_offset(text, record["index"])
+                    text = text[:offset] + record["text"] + text[offset:]
+                elif op == "delete":
+                    offset = text_offset(text, record["index"])
+                    text = text[:offset] + text[offset + len(record["text"]):]
+                elif op == "text":
+                    text = record["text"]
+                elif op == "attach":
+                    files[record["path"]] = record["name"]
+                elif op == "remove":
+                    files.pop(record["path"], None)
+                elif op == "clear":
+                    files.clear()
+            except (ValueError, KeyError, TypeError):
+                break  # a torn write from a crashed session; everything before it is intact
+    return text, files
+
+
+class DraftJournal:
+    """Append-only journal of the unsubmitted draft, so a crash or a closed window loses nothing.
+
+    Each line is one JSON record: an optional "snapshot" of the whole draft,
+    then "insert"/"delete"/"text" deltas of the prompt and "attach"/"remove"/
+    "clear" events for attachments. Records are batched on the UI thread
+    (consecutive keystrokes become one record), appended and fsync'ed on a
+    worker thread, and the journal is rewritten as a single snapshot every
+    DRAFT_COMPACT_RECORDS records.
+    """
+
+    def __init__(self, filepath, root, text_source, files_source, compact_after=DRAFT_COMPACT_RECORDS,
+                 lock=None):
+        self.filepath = filepath
+        self.lock = lock  # from lock_file; released on close
+        self.compact_after = compact_after
+        self._root = root
+        self._text_source = text_source    # returns the prompt text
+        self._files_source = files_source  # returns [{"path", "name"}] for the attachments
+        self._pending = []
+        self._first_pending = None
+        self._flush_after = None
+        self._records = 0
+        self._closed = False
+        # One writer keeps appends, compactions and the final discard in order
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="draft")
+
+    def text_changed(self, op, index, text):
+        """TextChangeTracker listener"""
+        if op == "reset":
+            self.record({"op": "text", "text": self._text_source()})
+            return
+        last = self._pending[-1] if self._pending else None
+        if last is not None and last["op"] == op and "\n" not in last["text"]:
+            if op == "insert" and advance_index(last["index"], last["text"]) == index:
+                last["text"] += text
+                self._schedule_flush()
+                return
+            if op == "delete" and "\n" not in text:
+                if index == last["index"]:
+                    last["text"] += text  # forward delete
+                    self._schedule_flush()
+                    return
+                if advance_index(index, text) == last["index"]:
+                    last["index"] = index  # backspace
+                    last["text"] = text + last["text"]
+                    self._schedule_flush()
+                    return
+        self.record({"op": op, "index": index, "text": text})
+
+    def record(self, record):
+        if self._closed:
+            return
+        self._pending.append(record)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        now = time.monotonic()
+        if self._first_pending is None:
+            self._first_pending = now
+        if self._flush_after is not None:
+            if now - self._first_pending >= DRAFT_MAX_DELAY:
+                return  # let the scheduled flush run so continuous typing is still saved
+            self._root.after_cancel(self._flush_after)
+        self._flush_after = self._root.after(DRAFT_DEBOUNCE_MS, self.flush)
+
+    def _cancel_flush(self):
+        if self._flush_after is not None:
+            try:
+                self._root.after_cancel(self._flush_after)
+            except tk.TclError:
+                pass  # the window is already gone
+        self._flush_after = None
+        self._first_pending = None
+
+    def flush(self):
+        """Hand the batched records to the writer (UI thread)"""
+        self._cancel_flush()
+        if not self._pending or self._closed:
+            return
+        self._records += len(self._pending)
+        if self._records >= self.compact_after:
+            self.compact()
+            return
+        self._append_pending()
+
+    def _append_pending(self):
+        data = "".join(json.dumps(record) + "\n" for record in self._pending)
+        self._pending = []
+        self._writer.submit(self._append, data)
+
+    def compact(self):
+        """Replace the journal with a snapshot of the current draft"""
+        self._cancel_flush()
+        self._pending = []
+        self._records = 0
+        snapshot = {"op": "snapshot", "text": self._text_source(), "files": self._files_source()}
+        # Serialized on the writer thread: a snapshot of a large folder drop can be megabytes
+        self._writer.submit(lambda: self._write((json.dumps(snapshot) + "\n").encode("utf-8")))
+
+    def _append(self, data):
+        try:
+            with open(self.filepath, "a", encoding="utf-8") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            log(f"Could not save draft: {e}")
+
+    def _write(self, data):
+        try:
+            write_file_atomic(self.filepath, data, fsync=True)
+        except OSError as e:
+            log(f"Could not save draft: {e}")
+
+    def discard(self):
+        """Forget the draft (it has been submitted); later edits start a new one"""
+        self._cancel_flush()
+        self._pending = []
+        self._records = 0
+        self._writer.submit(self._remove)
+
+    def _remove(self):
+        try:
+            os.remove(self.filepath)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            log(f"Could not remove draft: {e}")
+
+    def close(self):
+        """Write whatever is still batched and wait for the writer.
+
+        This runs after the window is destroyed, so the last batch is always
+        appended: compacting would read the prompt from a dead widget. The
+        next session compacts when it restores.
+        """
+        self._cancel_flush()
+        if self._pending and not self._closed:
+            self._append_pending()
+        self._closed = True
+        self._writer.shutdown(wait=True)
+        if self.lock is not None:
+            self.lock.close()
+
+
+class FolderScanner:
+    """Walks dropped folders on a background thread and streams their files back in batches.
+
+    os.scandir reports each entry's type from the directory read, so a file
+    costs at most one stat, and that stat is passed on with the file instead of
+    being repeated at attach time. Directories are visited once per
+    (st_dev, st_ino), so symlink loops end. Names and relative paths are
+    matched against the include/exclude globs; excluded directories are not
+    entered at all.
+    """
+
+    def __init__(self, deliver, roots, on_batch, on_done, include=(), exclude=FOLDER_EXCLUDE,
+                 max_files=FOLDER_MAX_FILES, max_bytes=FOLDER_MAX_BYTES):
+        self._deliver = deliver
+        self.roots = roots
+        self._on_batch = on_batch  # on_batch(scanner, [(path, relative name, stat), ...])
+        self._on_done = on_done    # on_done(scanner, files, total bytes, limit hit or None)
+        self.include = tuple(include)
+        self.exclude = tuple(exclude)
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self._cancelled = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="folder-scan", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @staticmethod
+    def _matches(patterns, name, relative):
+        return any(fnmatch.fnmatch(name, pattern) or fnmatch.fnmatch(relative, pattern) for pattern in patterns)
+
+    def _run(self):
+        batch = []
+        last_delivery = time.monotonic()
+        files = total = 0
+        limit = None
+        visited = set()
+        stack = [(root, os.path.basename(os.path.normpath(root))) for root in reversed(self.roots)]
+        try:
+            while stack and limit is None and not self._cancelled.is_set():
+                directory, relative = stack.pop()
+                try:
+                    st = os.stat(directory)
+                    if (st.st_dev, st.st_ino) in visited:
+                        continue
+                    visited.add((st.st_dev, st.st_ino))
+                    with os.scandir(directory) as it:
+                        entries = sorted(it, key=lambda entry: entry.name)
+                except OSError:
+                    continue
+                subdirs = []
+                for entry in entries:
+                    entry_relative = f"{relative}/{entry.name}"
+                    if self._matches(self.exclude, entry.name, entry_relative):
+                        continue
+                    try:
+                        if entry.is_dir():
+                            subdirs.append((entry.path, entry_relative))
+                            continue
+                        if not entry.is_file():
+                            continue
+                        if self.include and not self._matches(self.include, entry.name, entry_relative):
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    if files >= self.max_files:
+                        limit = f"{self.max_files:,} file limit"
+                        break
+                    if total + st.st_size > self.max_bytes:
+                        limit = f"{format_size(self.max_bytes)} size limit"
+                        break
+                    files += 1
+                    total += st.st_size
+                    batch.append((entry.path, entry_relative, st))
+                    if (len(batch) >= FOLDER_BATCH_SIZE
+                            or time.monotonic() - last_delivery >= FOLDER_BATCH_INTERVAL):
+                        self._deliver(self._on_batch, self, batch)
+                        batch = []
+                        last_delivery = time.monotonic()
+                stack.extend(reversed(subdirs))
+        finally:
+            if batch:
+                self._deliver(self._on_batch, self, batch)
+            self._deliver(self._on_done, self, files, total, limit)
+
+
+class ClipboardWatcher:
+    """Polls the clipboard on a background thread and reports new images.
+
+    Each tick asks for the cheapest change signal the platform offers and
+    only fetches the image when it moved:
+
+    - Windows: GetClipboardSequenceNumber
+    - macOS: NSPasteboard changeCount (pyobjc), else ``osascript clipboard info``
+    - Wayland: a ``wl-paste --watch`` subprocess that prints a line per change
+    - X11: the clipboard owner's TIMESTAMP target via xclip
+
+    Elsewhere the image itself is fetched and compared by a small fingerprint.
+    The poll interval backs off while nothing changes.
+    """
+
+    def __init__(self, deliver, on_image):
+        self._deliver = deliver
+        self._on_image = on_image
+        self._stop = threading.Event()
+        self._wayland = None
+        self._wayland_changes = 0
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="clipboard-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._wayland is not None:
+            self._wayland.terminate()
+            self._wayland = None
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def _token_source(self):
+        """Return a callable whose result changes whenever the clipboard does, or None"""
+        if sys.platform == "win32":
+            import ctypes
+            return ctypes.windll.user32.GetClipboardSequenceNumber
+        if sys.platform == "darwin":
+            try:
+                from AppKit import NSPasteboard
+                return NSPasteboard.generalPasteboard().changeCount
+            except ImportError:
+                # Lists the types and sizes on the clipboard without transferring the data
+                return lambda: self._command_output(["osascript", "-e", "clipboard info"])
+        if os.environ.get("WAYLAND_DISPLAY") and shutil.which("wl-paste"):
+            self._start_wayland_watch()
+            return lambda: self._wayland_changes
+        if os.environ.get("DISPLAY") and shutil.which("xclip"):
+            return lambda: self._command_output(["xclip", "-selection", "clipboard", "-t", "TIMESTAMP", "-o"])
+        return None
+
+    @staticmethod
+    def _command_output(args):
+        import subprocess
+        try:
+            return subprocess.run(args, capture_output=True, timeout=2).stdout
+        except (OSError, subprocess.SubprocessError):
+            return None
+
+    def _start_wayland_watch(self):
+        import subprocess
+        self._wayland = subprocess.Popen(["wl-paste", "--watch", "echo"],
+                                         stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+        def count_changes(stream):
+            for _ in stream:
+                self._wayland_changes += 1
+
+        threading.Thread(target=count_changes, args=(self._wayland.stdout,), daemon=True).start()
+
+    @staticmethod
+    def _fingerprint(image):
+        # Nearest-neighbour sampling touches only 256 pixels, not the whole image
+        sample = image.resize((16, 16), Image.Resampling.NEAREST).tobytes()
+        return (image.mode, image.size, hashlib.blake2b(sample, digest_size=16).digest())
+
+    def _run(self):
+        from PIL import ImageGrab
+        load_pil()
+        token = self._token_source()
+        # Whatever is on the clipboard when watching starts is not new
+        last_token = token() if token is not None else None
+        last_fingerprint = None
+        if token is None:
+            image = self._grab(ImageGrab)
+            last_fingerprint = self._fingerprint(image) if image is not None else None
+
+        interval = CLIPBOARD_POLL_MIN
+        while not self._stop.wait(interval):
+            interval = min(interval * 1.5, CLIPBOARD_POLL_MAX)
+            if token is not None:
+                current = token()
+                if current == last_token:
+                    continue
+                last_token = current
+            captured_at = time.perf_counter()
+            image = self._grab(ImageGrab)
+            if image is None:
+                continue
+            if token is None:
+                fingerprint = self._fingerprint(image)
+                if fingerprint == last_fingerprint:
+                    continue
+                last_fingerprint = fingerprint
+            interval = CLIPBOARD_POLL_MIN
+            self._deliver(self._on_image, image, captured_at)
+
+    @staticmethod
+    def _grab(image_grab):
+        try:
+            image = image_grab.grabclipboard()
+        except Exception:
+            return None
+        # File lists and text are left to the regular paste handlers
+        return image if isinstance(image, Image.Image) else None
+
+
+class MainLoopMonitor:
+    """Opt-in instrumentation for the Tk main loop.
+
+    A heartbeat scheduled with root.after detects stalls longer than
+    ``stall_threshold`` seconds; while one is in progress a watchdog thread
+    samples the main thread's stack. Handlers wrapped with @traced are timed
+    as spans. close() writes a Chrome trace (chrome://tracing, Perfetto) and
+    prints a percentile summary to stderr.
+    """
+
+    def __init__(self, root, trace_path, stall_threshold=0.1):
+        self.root = root
+        self.trace_path = trace_path
+        self.stall_threshold = stall_threshold
+        self._origin = time.perf_counter()
+        self._events = []
+        self._durations = {}  # span name -> [seconds]
+        self._stalls = []
+        self._main_ident = threading.main_thread().ident
+        self._pid = os.getpid()
+        self._last_beat = time.perf_counter()
+        self._stop = threading.Event()
+        self._watchdog = threading.Thread(target=self._watch, name="stall-watchdog", daemon=True)
+        self._watchdog.start()
+        self.root.after(MONITOR_HEARTBEAT_MS, self._beat)
+
+    def _ts(self, t):
+        return round((t - self._origin) * 1e6, 1)
+
+    def _add(self, event):
+        if len(self._events) < MONITOR_MAX_EVENTS:
+            event.setdefault("pid", self._pid)
+            self._events.append(event)
+
+    @contextmanager
+    def span(self, name, category="handler"):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self._durations.setdefault(name, []).append(end - start)
+            self._add({"name": name, "cat": category, "ph": "X", "tid": threading.get_ident(),
+                       "ts": self._ts(start), "dur": self._ts(end) - self._ts(start)})
+
+    def _beat(self):
+        now = time.perf_counter()
+        lag = now - self._last_beat - MONITOR_HEARTBEAT_MS / 1000
+        if lag > self.stall_threshold:
+            start = now - lag
+            self._stalls.append(lag)
+            self._add({"name": "main loop stall", "cat": "stall", "ph": "X", "tid": self._main_ident,
+                       "ts": self._ts(start), "dur": self._ts(now) - self._ts(start)})
+        self._last_beat = now
+        if not self._stop.is_set():
+            self.root.after(MONITOR_HEARTBEAT_MS, self._beat)
+
+    def _watch(self):
+        while not self._stop.wait(MONITOR_SAMPLE_INTERVAL):
+            now = time.perf_counter()
+            if now - self._last_beat - MONITOR_HEARTBEAT_MS / 1000 <= self.stall_threshold:
+                continue
+            frame = sys._current_frames().get(self._main_ident)
+            if frame is None:
+                continue
+            stack = [f"{fs.name} ({os.path.basename(fs.filename)}:{fs.lineno})"
+                     for fs in traceback.extract_stack(frame)]
+            del frame
+            self._add({"name": stack[-1] if stack else "?", "cat": "stall-sample", "ph": "i", "s": "t",
+                       "tid": self._main_ident, "ts": self._ts(now), "args": {"stack": stack}})
+
+    def summary(self):
+        """Per-span count and p50/p95/p99/max durations in milliseconds"""
+        rows = {}
+        for name, durations in sorted(self._durations.items()):
+            ordered = sorted(durations)
+
+            def pct(p):
+                return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+            rows[name] = {"count": len(ordered), "p50": pct(0.50), "p95": pct(0.95),
+                          "p99": pct(0.99), "max": ordered[-1] * 1000}
+        return rows
+
+    def close(self):
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        self._watchdog.join(timeout=1)
+
+        metadata = [{"name": "thread_name", "ph": "M", "pid": self._pid, "tid": self._main_ident,
+                     "args": {"name": "Tk main loop"}}]
+        try:
+            with open(self.trace_path, "w", encoding="utf-8") as f:
+                json.dump({"traceEvents": metadata + self._events, "displayTimeUnit": "ms"}, f)
+        except OSError as e:
+            log(f"could not write trace {self.trace_path}: {e}")
+
+        log(f"trace written to {self.trace_path}")
+        log(f"{'span':<40} {'count':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for name, row in self.summary().items():
+            log(f"{name:<40} {row['count']:>6} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+                f"{row['p99']:>8.1f} {row['max']:>8.1f}")
+        if self._stalls:
+            log(f"{len(self._stalls)} main-loop stalls over {self.stall_threshold * 1000:.0f} ms, "
+                f"longest {max(self._stalls) * 1000:.0f} ms, total {sum(self._stalls) * 1000:.0f} ms")
+        else:
+            log(f"no main-loop stalls over {self.stall_threshold * 1000:.0f} ms")
+
+
+def traced(func):
+    """Time a PromptInput handler when a MainLoopMonitor is attached"""
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if self.monitor is None:
+            return func(self, *args, **kwargs)
+        with self.monitor.span(func.__name__):
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    return os.path.join(runtime_dir or get_cache_dir(), SERVER_SOCKET_NAME)
+
+
+class PromptServer:
+    """Serves prompt requests for a resident PromptInput over a Unix socket.
+
+    Each connection carries one JSON request line and gets one JSON reply
+    line. Requests are handled one at a time on a background thread, so
+    other clients wait in the listen backlog while the window is up.
+    """
+
+    def __init__(self, app, path):
+        import socket
+        self.app = app
+        self.path = path
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                os.remove(path)  # left behind by a server that didn't exit cleanly
+            else:
+                raise RuntimeError(f"A prompt server is already listening on {path}")
+            finally:
+                probe.close()
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Bound under a private umask rather than only chmod'ed afterwards: in between, another
+        # user could connect and be handed the next prompt (the fallback directory isn't private)
+        umask = os.umask(0o077)
+        try:
+            self._sock.bind(path)
+        finally:
+            os.umask(umask)
+        os.chmod(path, 0o600)
+        self._sock.listen(8)
+        self._thread = threading.Thread(target=self._run, name="prompt-server", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                conn, _ = self._sock.accept()
+            except OSError:
+                return  # closed
+            with conn:
+                try:
+                    self._handle(conn)
+                except (OSError, ValueError) as e:
+                    log(f"prompt request failed: {e}")
+
+    def _handle(self, conn):
+        with conn.makefile("r", encoding="utf-8") as f:
+            line = f.readline()
+        if not line:
+            return  # e.g. another server probing whether this one is alive
+        request = json.loads(line)
+        if not isinstance(request, dict) or request.get("request") != "prompt":
+            reply = {"status": "error", "error": "expected a prompt request"}
+        else:
+            done = threading.Event()
+            result = {}
+
+            def on_result(value):
+                result.update(value)
+                done.set()
+
+            self.app.call_in_ui(self.app.begin_session, request, on_result)
+            done.wait()
+            reply = result
+        conn.sendall((json.dumps(reply) + "\n").encode("utf-8"))
+
+    def close(self):
+        self._sock.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
 
 
 class PromptInput:
-    def __init__(self):
+    def __init__(self, screenshot_format=None, screenshot_dir=None, output_format="text", inline_content=False,
+                 trace_path=None, stall_threshold_ms=100, paste_attach_threshold=PASTE_ATTACH_THRESHOLD,
+                 auto_paste=False, optimize_images=False, optimize_max_edge=PREPROCESS_MAX_EDGE,
+                 optimize_format=PREPROCESS_FORMAT, optimize_quality=PREPROCESS_QUALITY, draft=True,
+                 folder_include=(), folder_exclude=FOLDER_EXCLUDE, folder_max_files=FOLDER_MAX_FILES,
+                 folder_max_bytes=FOLDER_MAX_BYTES, bundle=None, bundle_format="tar", bundle_compression="auto",
+                 screenshot_max_bytes=None, screenshot_max_age=None):
+        load_gui()
+
         # Set customtkinter appearance mode and color theme
         ctk.set_appearance_mode("system")  # Modes: "system" (default), "dark", "light"
         ctk.set_default_color_theme("blue")  # Themes: "blue" (default), "green", "dark-blue"
-        
-        # Initialize customtkinter window
-        if DND_AVAILABLE:
-            # Use TkinterDnD for drag and drop support
-            self.root = TkinterDnD.Tk()
-            # Apply customtkinter styling
-            ctk.set_widget_scaling(1.0)
-        else:
-            # Use customtkinter window
-            self.root = ctk.CTk()
-            
+
+        # Initialize customtkinter window; drag and drop is loaded into it after the first frame
+        self.root = ctk.CTk()
+
         self.root.title("✨ AI Assistant Prompt Input")
         self.root.geometry("1000x750")
         self.root.minsize(900, 650)
         self.root.resizable(False, False)
 
-        self.attached_files = []
-        self.file_previews = []
+        self.monitor = MainLoopMonitor(self.root, trace_path, stall_threshold_ms / 1000) if trace_path else None
+
+        self.output_format = output_format
+        self.inline_content = inline_content
+        self.bundle = bundle
+        self.bundle_format = bundle_format
+        self.bundle_compression = bundle_compression
+        self.paste_attach_threshold = paste_attach_threshold
+        self._text_paste = None  # in-progress chunked paste, see start_text_paste
+        self._counter_pending = False
+
+        # Insertion-ordered index of filepath -> Attachment: O(1) duplicate checks and removal
+        self.attached_files = {}
+        self._file_list_stale = False
+        self._file_list_sync = None  # after_idle id of a deferred sync_file_list
+
+        self.screenshot_format = screenshot_format or DEFAULT_SCREENSHOT_FORMAT
+        if self.screenshot_format not in SCREENSHOT_FORMATS:
+            raise ValueError(f"Unknown screenshot format: {self.screenshot_format}")
+        # Screenshots are encoded one at a time, in paste order, off the UI thread
+        self.screenshot_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="screenshot")
+        self.pending_screenshots = {}  # filepath -> Future of its background save
+        if screenshot_max_bytes is None:
+            max_mb = env_number("USERINPUT_SCREENSHOT_MAX_MB")
+            screenshot_max_bytes = SCREENSHOT_MAX_BYTES if max_mb is None else int(max_mb * 1024 ** 2)
+        if screenshot_max_age is None:
+            max_days = env_number("USERINPUT_SCREENSHOT_MAX_DAYS")
+            screenshot_max_age = SCREENSHOT_MAX_AGE if max_days is None else max_days * 24 * 60 * 60
+        self.screenshot_store = ScreenshotStore(screenshot_dir
+                                                or os.environ.get("USERINPUT_SCREENSHOT_DIR")
+                                                or get_cache_dir("screenshots"),
+                                                screenshot_max_bytes, screenshot_max_age)
+
+        # Worker threads hand results back through this queue; it is drained on the main loop
+        self._ui_calls = queue.SimpleQueue()
+        try:
+            thumbnail_cache = ThumbnailCache(get_cache_dir("thumbnails"))
+        except OSError:
+            thumbnail_cache = None
+        self.thumbnail_loader = ThumbnailLoader(self.call_in_ui, thumbnail_cache)
+
+        # Content-based deduplication: same-size files are candidates, digests decide
+        self.hasher = ContentHasher(self.call_in_ui, HashCache(os.path.join(get_cache_dir(), "hashes.json")))
+        self._size_index = {}    # size -> {filepath: Attachment}
+        self._digest_index = {}  # digest -> filepath of the attachment that owns it
+
+        # Optional upload-ready copies of attached images, made in worker processes
+        self.preprocessor = None
+        if optimize_images and PIL_AVAILABLE:
+            self.preprocessor = ImagePreprocessor(self.call_in_ui, get_cache_dir("optimized"),
+                                                  optimize_max_edge, optimize_format, optimize_quality)
+
+        # Dropped folders are walked in the background; see scan_folders
+        self.folder_options = {"include": folder_include, "exclude": folder_exclude,
+                               "max_files": folder_max_files, "max_bytes": folder_max_bytes}
+        self._folder_scans = {}  # FolderScanner -> {"added", "skipped", "failed"} counts
+
+        self.clipboard_watcher = None
+        self.draft = None  # DraftJournal, once the previous draft has been restored
+        self.server = None   # PromptServer in --serve mode
+        self.session = None  # reply callback of the client whose prompt is being shown
+
         self.setup_ui()
         self.bind_events()
+        self.root.after(UI_POLL_MS, self._process_ui_calls)
+        if draft:
+            self.restore_draft()
+        if auto_paste and PIL_AVAILABLE:
+            self.auto_paste_switch.select()
+            self.set_auto_paste(True)
+
+    def restore_draft(self, filepath=None):
+        """Reload the last unsubmitted draft, then journal this session's edits.
+
+        Attachments are re-stat'ed, and their thumbnails and digests come from
+        the persistent caches, so restoring doesn't decode or hash anything.
+        Only one instance owns the draft at a time; while another window (or
+        a --serve process) holds its lock, this one neither restores nor saves.
+        """
+        filepath = filepath or os.path.join(get_cache_dir("drafts"), "draft.jsonl")
+        try:
+            lock = lock_file(filepath + ".lock")
+        except OSError as e:
+            log(f"Could not lock draft: {e}")
+            return
+        if lock is None:
+            log("Draft is in use by another instance; this one won't be saved")
+            return
+        try:
+            restored = load_draft(filepath)
+        except OSError as e:
+            log(f"Could not read draft: {e}")
+            restored = None
+        added, failed = [], []
+        if restored is not None:
+            text, files = restored
+            if text:
+                self.prompt_input.insert("1.0", text)
+            if files:
+                added, _, _, failed = self.add_files(list(files), files, quiet=True)
+
+        self.draft = DraftJournal(filepath, self.root, self.text_tracker.text, self.draft_files, lock=lock)
+        self.text_tracker.listeners.append(self.draft.text_changed)
+        if restored is not None:
+            # The restored state becomes this session's base; the old deltas aren't replayed twice
+            self.draft.compact()
+            text, files = restored
+            if text or files:
+                message = f"Restored draft ({len(text):,} characters, {len(added)} files)"
+                if failed:
+                    message += f" · {len(failed)} attached file{'s' if len(failed) != 1 else ''} no longer exist"
+                self.status_label.configure(text=message)
+
+    def draft_files(self):
+        return [{"path": item.path, "name": item.name} for item in self.attached_files.values()]
+
+    def call_in_ui(self, func, *args):
+        """Schedule func(*args) on the Tk main loop (safe to call from worker threads)"""
+        self._ui_calls.put((func, args))
+
+    def _process_ui_calls(self):
+        deadline = time.perf_counter() + UI_POLL_BUDGET
+        try:
+            while time.perf_counter() < deadline:
+                try:
+                    func, args = self._ui_calls.get_nowait()
+                except queue.Empty:
+                    break
+                try:
+                    if self.monitor is None:
+                        func(*args)
+                    else:
+                        with self.monitor.span(getattr(func, "__qualname__", "ui call"), "ui-call"):
+                            func(*args)
+                except Exception:
+                    traceback.print_exc()
+        finally:
+            self.root.after(UI_POLL_MS, self._process_ui_calls)
 
     def setup_ui(self):
         # Main container with transparent background to remove white padding
@@ -83,15 +2406,29 @@ class PromptInput:
                                      height=30)
         system_button.pack(side="left", padx=5)
 
+        if PIL_AVAILABLE:
+            self.auto_paste_switch = ctk.CTkSwitch(theme_frame,
+                                                   text="Auto-paste screenshots",
+                                                   command=lambda: self.set_auto_paste(bool(self.auto_paste_switch.get())))
+            self.auto_paste_switch.pack(side="left", padx=5)
+
         # Content frame with modern styling and proper padding
         content_frame = ctk.CTkFrame(main_container)
         content_frame.pack(fill="both", expand=True, pady=(0, 15))
 
         # Prompt input section with padding
-        prompt_label = ctk.CTkLabel(content_frame,
+        prompt_header = ctk.CTkFrame(content_frame, fg_color="transparent")
+        prompt_header.pack(fill="x", padx=20, pady=(20, 10))
+
+        prompt_label = ctk.CTkLabel(prompt_header,
                                    text="📝 Your Prompt:",
                                    font=ctk.CTkFont(size=14, weight="bold"))
-        prompt_label.pack(anchor="w", padx=20, pady=(20, 10))
+        prompt_label.pack(side="left")
+
+        self.counter_label = ctk.CTkLabel(prompt_header, text="",
+                                          font=ctk.CTkFont(size=11),
+                                          text_color=("gray60", "gray40"))
+        self.counter_label.pack(side="right")
 
         # Use CTkTextbox for better integration with customtkinter
         self.prompt_input = ctk.CTkTextbox(content_frame,
@@ -101,34 +2438,41 @@ class PromptInput:
                                           corner_radius=10)
         self.prompt_input.pack(fill="x", padx=20, pady=(0, 15))
 
+        # Counts are kept from insert/delete deltas instead of re-reading the whole text
+        self.text_tracker = TextChangeTracker(self.prompt_input._textbox)
+        self.text_tracker.listeners.append(lambda op, index, text: self.schedule_counter_update())
+        self.update_counter()
+
         # File section with padding
         file_section_label = ctk.CTkLabel(content_frame,
                                           text="📁 Attached Files:",
                                           font=ctk.CTkFont(size=14, weight="bold"))
         file_section_label.pack(anchor="w", padx=20, pady=(10, 10))
 
-        self.file_preview_frame = ctk.CTkScrollableFrame(content_frame, height=80)
-        self.file_preview_frame.pack(fill="x", padx=20, pady=(0, 15))
-
-        # Enable drag and drop if available - use the underlying tkinter widget
+        self.file_list = VirtualFileList(content_frame,
+                                         height=120,
+                                         empty_text="No files attached yet. Drag & drop files here or use buttons below.",
+                                         on_remove=lambda item: self.remove_file(item.path),
+                                         on_bind=self.request_thumbnail,
+                                         on_unbind=lambda item: self.thumbnail_loader.cancel(item.path))
+        self.file_list.pack(fill="x", padx=20, pady=(0, 5))
+
+        self.status_label = ctk.CTkLabel(content_frame, text="",
+                                         font=ctk.CTkFont(size=11),
+                                         text_color=("gray60", "gray40"),
+                                         anchor="w")
+        self.status_label.pack(fill="x", padx=20)
+
+        # Shown only while dropped folders are being scanned
+        self.scan_cancel_button = ctk.CTkButton(content_frame,
+                                                text="Stop adding files",
+                                                command=self.cancel_folder_scans,
+                                                width=130,
+                                                height=24)
+
+        # Enable drag and drop if available, once the window is up
         if DND_AVAILABLE:
-            # Get the underlying tkinter widget for drag and drop compatibility
-            underlying_widget = self.file_preview_frame._parent_canvas
-            underlying_widget.drop_target_register(DND_FILES)
-            underlying_widget.dnd_bind('<<Drop>>', self.handle_drop)
-            
-            # Also register on the scrollable frame itself
-            try:
-                self.file_preview_frame.drop_target_register(DND_FILES)
-                self.file_preview_frame.dnd_bind('<<Drop>>', self.handle_drop)
-            except:
-                pass
-
-        self.no_files_label = ctk.CTkLabel(self.file_preview_frame,
-                                          text="No files attached yet. Drag & drop files here or use buttons below.",
-                                          font=ctk.CTkFont(size=11),
-                                          text_color=("gray60", "gray40"))
-        self.no_files_label.pack()
+            self.root.after_idle(self.enable_drag_and_drop)
 
         button_frame = ctk.CTkFrame(content_frame, fg_color="transparent")
         button_frame.pack(fill="x", padx=20, pady=(10, 20))
@@ -192,6 +2536,16 @@ class PromptInput:
                                        text_color=("gray60", "gray40"))
             instructions.pack()
 
+    def enable_drag_and_drop(self):
+        """Load tkdnd into the running interpreter and register the file list as a drop target"""
+        try:
+            from tkinterdnd2 import DND_FILES, TkinterDnD
+            TkinterDnD.require(self.root)
+        except Exception as e:
+            log(f"drag and drop unavailable: {e} (pip install tkinterdnd2)")
+            return
+        self.file_list.enable_drop(DND_FILES, self.handle_drop)
+
     def toggle_theme(self):
         current_mode = ctk.get_appearance_mode()
         if current_mode == "Light":
@@ -223,27 +2577,135 @@ class PromptInput:
         
         # Enable normal text pasting
         self.prompt_input.bind('<Control-v>', self.handle_text_paste)
+        self.root.bind('<Escape>', self.cancel_text_paste)
+        self.root.bind('<Escape>', self.cancel_folder_scans, add="+")
         
         # Enable image pasting with different key combination
         if PIL_AVAILABLE:
             self.root.bind('<Control-Shift-v>', self.handle_paste)
             self.prompt_input.bind('<Control-Shift-v>', self.handle_paste)
 
+    @traced
     def handle_text_paste(self, event=None):
         """Handle normal text pasting with Ctrl+V"""
         try:
             # Get text from clipboard
             clipboard_text = self.root.clipboard_get()
             if clipboard_text:
+                if self.paste_attach_threshold and len(clipboard_text) >= self.paste_attach_threshold:
+                    if messagebox.askyesno("Large Paste",
+                                           f"The clipboard holds {len(clipboard_text):,} characters.\n\n"
+                                           "Attach it as a text file instead of pasting it into the prompt?"):
+                        self.attach_pasted_text(clipboard_text)
+                        return "break"
+                # A paste still in progress is completed first, so this one lands after it
+                self.finish_text_paste()
                 # Insert text at current cursor position
                 current_pos = self.prompt_input.index(tk.INSERT)
-                self.prompt_input.insert(current_pos, clipboard_text)
+                if len(clipboard_text) <= PASTE_CHUNK_CHARS:
+                    self.prompt_input.insert(current_pos, clipboard_text)
+                else:
+                    self.start_text_paste(clipboard_text, current_pos)
                 return "break"  # Prevent default paste behavior
         except tk.TclError:
             # No text in clipboard, allow default behavior
             pass
         return None
 
+    def start_text_paste(self, text, index):
+        """Insert a large paste a chunk at a time from idle callbacks, so the window stays responsive"""
+        self.finish_text_paste()
+        textbox = self.prompt_input._textbox
+        # Left-gravity start mark and right-gravity end mark bracket the text inserted so far
+        textbox.mark_set("paste_start", index)
+        textbox.mark_gravity("paste_start", "left")
+        textbox.mark_set("paste_end", index)
+        textbox.mark_gravity("paste_end", "right")
+        self._text_paste = {"text": text, "offset": 0, "after": None}
+        self._continue_text_paste()
+
+    def _continue_text_paste(self):
+        paste = self._text_paste
+        if paste is None:
+            return
+        text = paste["text"]
+        deadline = time.perf_counter() + PASTE_STEP_BUDGET
+        while paste["offset"] < len(text) and time.perf_counter() < deadline:
+            chunk = text[paste["offset"]:paste["offset"] + PASTE_CHUNK_CHARS]
+            self.prompt_input.insert("paste_end", chunk)
+            paste["offset"] += len(chunk)
+        if paste["offset"] >= len(text):
+            self._text_paste = None
+            self.status_label.configure(text=f"Pasted {len(text):,} characters")
+            return
+        percent = paste["offset"] * 100 // len(text)
+        self.status_label.configure(text=f"Pasting… {percent}% (Esc to cancel)")
+        paste["after"] = self.root.after(1, self._continue_text_paste)
+
+    def finish_text_paste(self):
+        """Insert the rest of an in-progress chunked paste at once"""
+        paste, self._text_paste = self._text_paste, None
+        if paste is None:
+            return
+        if paste["after"] is not None:
+            self.root.after_cancel(paste["after"])
+        self.prompt_input.insert("paste_end", paste["text"][paste["offset"]:])
+
+    def cancel_text_paste(self, event=None):
+        """Stop an in-progress chunked paste and remove what it inserted"""
+        paste = self._text_paste
+        if paste is None:
+            return None
+        self._text_paste = None
+        if paste["after"] is not None:
+            self.root.after_cancel(paste["after"])
+        self.prompt_input.delete("paste_start", "paste_end")
+        self.status_label.configure(text="Paste cancelled")
+        return "break"
+
+    def attach_pasted_text(self, text):
+        """Attach pasted text as a .txt file, written in the background"""
+        data = text.encode("utf-8")
+        filepath = self.screenshot_store.new_path(".txt", prefix="pasted_text")
+        item = Attachment(filepath, os.path.basename(filepath), icon="📃")
+        item.size = len(data)
+        self.add_attachment(item)
+        self.sync_file_list()
+        self.file_list.scroll_to_end()
+
+        def on_written(future):
+            self.pending_screenshots.pop(filepath, None)
+            try:
+                st = future.result()
+            except Exception as e:
+                self.status_label.configure(text=f"Failed to save pasted text: {e}")
+                return
+            self.screenshot_store.update(filepath, st.st_size)
+            if filepath not in self.attached_files:
+                self.screenshot_store.release(filepath)
+                return
+            item.update_stat(st)
+            self.file_list.refresh_item(item)
+
+        future = self.screenshot_writer.submit(write_file_atomic, filepath, data)
+        self.pending_screenshots[filepath] = future
+        future.add_done_callback(lambda f: self.call_in_ui(on_written, f))
+        self.status_label.configure(text=f"Attached {len(text):,} pasted characters as {item.name}")
+
+    def schedule_counter_update(self):
+        # Coalesce bursts of edits (typing, chunked pastes) into one label update
+        if not self._counter_pending:
+            self._counter_pending = True
+            self.root.after_idle(self.update_counter)
+
+    def update_counter(self):
+        self._counter_pending = False
+        chars, lines = self.text_tracker.chars, self.text_tracker.lines
+        # Roughly four characters per token for English text
+        self.counter_label.configure(
+            text=f"{chars:,} chars · {lines:,} line{'s' if lines != 1 else ''} · ~{(chars + 3) // 4:,} tokens")
+
+    @traced
     def handle_paste(self, event=None):
         if hasattr(self, '_pasting') and self._pasting:
             return "break"
@@ -268,61 +2730,153 @@ class PromptInput:
         self.paste_image()
         return "break"
 
-    def clear_old_screenshots(self):
-        """Delete old screenshot files from the screenshot folder"""
-        try:
-            screenshot_folder = os.path.join(os.getcwd(), "screenshot")
-            if os.path.exists(screenshot_folder):
-                for filename in os.listdir(screenshot_folder):
-                    if filename.startswith("pasted_image_") and filename.endswith(".png"):
-                        filepath = os.path.join(screenshot_folder, filename)
-                        try:
-                            os.remove(filepath)
-                        except:
-                            pass  # Ignore errors when deleting
-        except:
-            pass  # Ignore errors
+    def set_auto_paste(self, enabled):
+        """Attach new clipboard images automatically while enabled"""
+        if enabled:
+            self._auto_paste = True
+            if self.clipboard_watcher is None:
+                self.clipboard_watcher = ClipboardWatcher(self.call_in_ui, self.auto_paste_image)
+            self.clipboard_watcher.start()
+            self.status_label.configure(text="Auto-paste on: new clipboard images will be attached")
+        else:
+            if hasattr(self, '_auto_paste'):
+                del self._auto_paste
+            if self.clipboard_watcher is not None:
+                self.clipboard_watcher.stop()
+            self.status_label.configure(text="Auto-paste off")
+
+    @traced
+    def auto_paste_image(self, image, captured_at):
+        """Attach an image the clipboard watcher found (duplicates are merged before encoding)"""
+        if not hasattr(self, '_auto_paste'):
+            return
+        extension, _ = SCREENSHOT_FORMATS[self.screenshot_format]
+        filepath = self.screenshot_store.new_path(extension)
+        self.attach_pasted_image(image, filepath, os.path.basename(filepath), captured_at)
 
+    @traced
     def paste_image(self):
         if not PIL_AVAILABLE:
             messagebox.showwarning("PIL Not Available", "Please install Pillow: pip install Pillow")
             return
 
         try:
+            from PIL import ImageGrab
+            load_pil()
+            captured_at = time.perf_counter()
             image = ImageGrab.grabclipboard()
+            if isinstance(image, list):
+                # Files copied in a file manager arrive as a list of paths
+                self.ingest_paths(image)
+                return
             if image is None:
                 if not hasattr(self, '_auto_paste'):
                     messagebox.showinfo("No Image", "No image found in clipboard")
                 return
 
-            # Clear old screenshots before adding new one
-            self.clear_old_screenshots()
+            extension, _ = SCREENSHOT_FORMATS[self.screenshot_format]
+            filepath = self.screenshot_store.new_path(extension)
+            filename = os.path.basename(filepath)
 
-            # ✅ Create 'screenshot' folder if not exists
-            screenshot_folder = os.path.join(os.getcwd(), "screenshot")
-            os.makedirs(screenshot_folder, exist_ok=True)
+            self.attach_pasted_image(image, filepath, filename, captured_at)
 
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S_%f")
-            filename = f"pasted_image_{timestamp}.png"
-            filepath = os.path.join(screenshot_folder, filename)
+        except Exception as e:
+            messagebox.showerror("Error", f"Failed to paste image: {str(e)}")
 
-            image.save(filepath)
-            self.add_file_to_ui(filepath, filename)
+    def attach_pasted_image(self, image, filepath, filename, captured_at):
+        """Show a pasted image immediately and encode it to disk in the background"""
+        item = Attachment(filepath, filename, icon="🖼️", is_image=True)
+        item.image = image
+        item.dimensions = image.size
+        self.add_attachment(item)
+        self.sync_file_list()
+        self.file_list.scroll_to_end()
 
-            if not hasattr(self, '_auto_paste'):
-                messagebox.showinfo("Success", f"Screenshot saved to screenshot folder as {filename}")
+        latency = {}
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to paste image: {str(e)}")
+        def report():
+            if "visible" not in latency or "persisted" not in latency:
+                return
+            persisted = latency["persisted"]
+            persisted_text = "kept in memory until submit" if persisted is None else f"{persisted:.1f} ms"
+            log(f"{filename}: capture→visible {latency['visible']:.1f} ms, "
+                f"capture→persisted {persisted_text} ({self.screenshot_format})")
+
+        def on_visible():
+            latency["visible"] = (time.perf_counter() - captured_at) * 1000
+            self.status_label.configure(text=f"Pasted {filename} ({image.width}×{image.height})")
+            report()
+
+        def on_persisted(future):
+            self.pending_screenshots.pop(filepath, None)
+            try:
+                st = future.result()
+            except Exception as e:
+                if filepath in self.attached_files:
+                    self.status_label.configure(text=f"Failed to save {filename}: {e}")
+                return
+            latency["persisted"] = (time.perf_counter() - captured_at) * 1000
+            self.screenshot_store.update(filepath, st.st_size)
+            if filepath not in self.attached_files:
+                # Removed while it was being encoded
+                self.screenshot_store.release(filepath)
+                return
+            item.image = None
+            item.update_stat(st)
+            self.file_list.refresh_item(item)
+            self.request_preprocess(item)
+            report()
+
+        def on_hashed(digest):
+            item.status = ""
+            if filepath not in self.attached_files:
+                return
+            if digest is not None and self.merge_duplicate(item, digest):
+                return
+            self.file_list.refresh_item(item)
+            # Only encode images that aren't already attached
+            if self.screenshot_format == "memory":
+                latency["persisted"] = None
+                report()
+                return
+            future = self.screenshot_writer.submit(save_screenshot, image, filepath, self.screenshot_format)
+            self.pending_screenshots[filepath] = future
+            future.add_done_callback(lambda f: self.call_in_ui(on_persisted, f))
+
+        # Idle callbacks run after Tk has redrawn the newly placed row
+        self.root.after_idle(on_visible)
 
+        item.status = "hashing…"
+        self.hasher.request(filepath, on_hashed, hash_image, image)
+
+    def persist_screenshots(self):
+        """Make sure every pasted image is on disk before its path is handed out"""
+        for filepath, future in list(self.pending_screenshots.items()):
+            try:
+                item = self.attached_files.get(filepath)
+                st = future.result()
+                self.screenshot_store.update(filepath, st.st_size)
+                if item is not None:
+                    item.image = None
+                    item.update_stat(st)
+            except Exception:
+                pass
+        self.pending_screenshots.clear()
+        for item in self.attached_files.values():
+            if item.image is not None:
+                try:
+                    item.update_stat(save_screenshot(item.image, item.path, self.screenshot_format))
+                    self.screenshot_store.update(item.path, item.size)
+                    item.image = None
+                except Exception:
+                    pass
+
+    @traced
     def handle_drop(self, event):
         """Handle drag and drop files"""
-        files = self.root.tk.splitlist(event.data)
-        for filepath in files:
-            if os.path.isfile(filepath):
-                filename = os.path.basename(filepath)
-                self.add_file_to_ui(filepath, filename)
+        self.ingest_paths(self.root.tk.splitlist(event.data))
 
+    @traced
     def attach_file(self):
         filetypes = [
             ("All files", "."),
@@ -337,33 +2891,34 @@ class PromptInput:
             filetypes=filetypes
         )
 
-        for filepath in filepaths:
-            filename = os.path.basename(filepath)
-            self.add_file_to_ui(filepath, filename)
+        self.add_files(filepaths)
 
+    @traced
     def clear_all_files(self):
         """Clear all attached files"""
+        self.cancel_folder_scans()
+        self.thumbnail_loader.cancel_all()
+        if self.thumbnail_loader.cache is not None:
+            self.thumbnail_loader.cache.release_all()
+        self.hasher.cancel_all()
+        if self.preprocessor is not None:
+            self.preprocessor.cancel_all()
         self.attached_files.clear()
-        self.file_previews.clear()
-        
-        # Clear the preview frame
-        for widget in self.file_preview_frame.winfo_children():
-            widget.destroy()
-            
-        # Show the no files label
-        self.no_files_label = ctk.CTkLabel(self.file_preview_frame,
-                                          text="No files attached yet. Drag & drop files here or use buttons below.",
-                                          font=ctk.CTkFont(size=11),
-                                          text_color=("gray60", "gray40"))
-        self.no_files_label.pack(pady=20)
-        
-        # Clear old screenshots
-        self.clear_old_screenshots()
+        if self.draft is not None:
+            self.draft.record({"op": "clear"})
+        self._size_index.clear()
+        self._digest_index.clear()
+        self.file_list.items = []
+        self._file_list_stale = False
+
+        # Only the recycled row pool needs resetting, however many files were attached
+        self.file_list.clear()
+        self.screenshot_store.release_all()
 
     def get_file_icon(self, filepath):
         """Get appropriate icon for file type"""
         ext = os.path.splitext(filepath)[1].lower()
-        if ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp']:
+        if ext in IMAGE_EXTENSIONS:
             return "🖼️"
         elif ext in ['.pdf']:
             return "📄"
@@ -382,115 +2937,948 @@ class PromptInput:
         else:
             return "📁"
 
+    @traced
     def add_file_to_ui(self, filepath, filename):
-        # Check if file already exists
-        if filepath in self.attached_files:
+        """Attach a single file"""
+        return self.add_files([filepath], names={filepath: filename})
+
+    def ingest_paths(self, paths):
+        """Attach dropped or pasted paths, scanning any folders among them in the background"""
+        folders = [path for path in paths if os.path.isdir(path)]
+        if folders:
+            self.scan_folders(folders)
+            folder_set = set(folders)
+            paths = [path for path in paths if path not in folder_set]
+        if paths or not folders:
+            self.add_files(paths)
+
+    def scan_folders(self, folders):
+        scanner = FolderScanner(self.call_in_ui, folders, self.add_scanned_files, self.finish_folder_scan,
+                                **self.folder_options)
+        self._folder_scans[scanner] = {"added": 0, "skipped": 0, "merged": 0, "failed": 0}
+        self.scan_cancel_button.pack(anchor="e", padx=20, after=self.status_label)
+        self.status_label.configure(text=f"Scanning {', '.join(os.path.basename(f) for f in folders)}…")
+        scanner.start()
+
+    def add_scanned_files(self, scanner, batch):
+        counts = self._folder_scans.get(scanner)
+        if counts is None:
+            return  # cancelled
+        added, skipped, merged, failed = self.add_files([path for path, _, _ in batch],
+                                                {path: name for path, name, _ in batch}, quiet=True,
+                                                stats={path: st for path, _, st in batch})
+        counts["added"] += len(added)
+        counts["skipped"] += len(skipped)
+        counts["merged"] += len(merged)
+        counts["failed"] += len(failed)
+        self.status_label.configure(text=f"Scanning… {counts['added']:,} files added")
+
+    def finish_folder_scan(self, scanner, files, total, limit):
+        counts = self._folder_scans.pop(scanner, None)
+        if counts is None:
+            return
+        if not self._folder_scans:
+            self.scan_cancel_button.pack_forget()
+        parts = [f"Added {counts['added']:,} file{'s' if counts['added'] != 1 else ''} "
+                 f"({format_size(total)}) from {', '.join(os.path.basename(f) for f in scanner.roots)}"]
+        if counts["skipped"]:
+            parts.append(f"{counts['skipped']:,} already attached")
+        if counts["merged"]:
+            parts.append(f"{counts['merged']:,} identical to attached files")
+        if counts["failed"]:
+            parts.append(f"{counts['failed']:,} failed")
+        if limit:
+            parts.append(f"stopped at the {limit}")
+        self.status_label.configure(text=" · ".join(parts))
+
+    def cancel_folder_scans(self, event=None):
+        if not self._folder_scans:
+            return None
+        added = sum(counts["added"] for counts in self._folder_scans.values())
+        for scanner in self._folder_scans:
+            scanner.cancel()
+        self._folder_scans.clear()
+        self.scan_cancel_button.pack_forget()
+        self.status_label.configure(text=f"Stopped adding files from folders · {added:,} added")
+        return "break"
+
+    @traced
+    def add_files(self, paths, names=None, quiet=False, stats=None):
+        """Attach many files with one layout pass and one summary.
+
+        names and stats optionally map paths to display names and to stat
+        results the caller already has. Returns (added, skipped, merged,
+        failed) lists of paths; skipped files were already attached, merged
+        ones had the same content as an attached file (known from the hash
+        cache), failed ones could not be read as regular files.
+        """
+        added, skipped, merged, failed = [], [], [], []
+        for filepath in paths:
+            if filepath in self.attached_files:
+                skipped.append(filepath)
+                continue
+            filename = names.get(filepath) if names else None
+            item = self.make_attachment(filepath, filename or os.path.basename(filepath),
+                                        stats.get(filepath) if stats else None)
+            if item is None:
+                failed.append(filepath)
+                continue
+            if self.add_attachment(item):
+                added.append(filepath)
+            else:
+                merged.append(filepath)
+
+        if added:
+            self.sync_file_list()
+            self.file_list.scroll_to_end()
+        if not quiet:
+            self.report_ingest(added, skipped, merged, failed)
+        return added, skipped, merged, failed
+
+    def add_attachment(self, item):
+        """Index an attachment and append it to the list view (layout happens on the next sync).
+
+        Returns False if it turned out to duplicate an attached file and was merged away at once.
+        """
+        self.attached_files[item.path] = item
+        self.screenshot_store.retain(item.path)
+        if self.draft is not None:
+            self.draft.record({"op": "attach", "path": item.path, "name": item.name})
+        if not self._file_list_stale:
+            self.file_list.items.append(item)
+        if item.cache_key is not None:
+            self.check_duplicate(item)
+            if item.path not in self.attached_files:
+                return False  # merged with the attachment that has the same content
+            if item.is_image and item.image is None:
+                self.request_preprocess(item)
+                if item.dimensions is None:
+                    self.request_dimensions(item)
+        return True
+
+    def request_dimensions(self, item):
+        """Read an image's size from its header, so rows never scrolled into view still report it"""
+        def apply(dimensions):
+            if item.dimensions is None:
+                item.dimensions = dimensions
+        self.hasher.request(("dimensions", item.path), apply, image_dimensions, item.path)
+
+    def request_preprocess(self, item):
+        """Start making an upload-ready copy of an attached image, if optimization is on"""
+        if self.preprocessor is None:
+            return
+        digest = item.digest or self.hasher.cache.peek(item.cache_key)
+        self.preprocessor.request(item.path, item.path, lambda result: self.apply_preprocessed(item, result),
+                                  digest)
+
+    def apply_preprocessed(self, item, result):
+        if result is None or item.path not in self.attached_files:
+            return
+        digest, path, size = result
+        if item.digest is None:
+            # The worker hashed the whole file, which duplicate detection can reuse
+            self.hasher.cache.put(item.cache_key, digest)
+        item.set_optimized(path, size)
+        self.file_list.refresh_item(item)
+
+    def check_duplicate(self, item):
+        """Look for an attached file with the same content, hashing in the background if needed"""
+        known = self.hasher.cache.peek(item.cache_key)
+        if known is not None and self.merge_duplicate(item, known):
+            return
+        # Only same-size attachments can match; with a cached digest, only the
+        # peers whose digest is still unknown need looking at
+        peers = self._size_index.setdefault(item.size, {})
+        candidates = [(path, peer.cache_key) for path, peer in peers.items()
+                      if known is None or peer.digest is None]
+        peers[item.path] = item
+        if not candidates:
+            return
+        item.status = "hashing…"
+        self.hasher.request(item.path, lambda digests: self.apply_digests(item, digests),
+                            find_duplicate_digests, self.hasher.cache, item.path, item.cache_key, candidates)
+
+    def apply_digests(self, item, digests):
+        item.status = ""
+        if item.path not in self.attached_files:
+            return
+        digests = digests or {}
+        digest = digests.get(item.path)
+        # Peers were attached first, so they own a shared digest rather than item
+        if digest is not None and self._digest_index.get(digest) == item.path:
+            del self._digest_index[digest]
+        for path, peer_digest in digests.items():
+            other = self.attached_files.get(path)
+            if other is not None and other is not item and peer_digest is not None:
+                other.digest = peer_digest
+                self._digest_index.setdefault(peer_digest, path)
+        if digest is None or not self.merge_duplicate(item, digest):
+            self.file_list.refresh_item(item)
+
+    def merge_duplicate(self, item, digest):
+        """Record item's digest; if an earlier attachment has the same content, drop item and return True"""
+        item.digest = digest
+        owner = self._digest_index.get(digest)
+        if owner is not None and owner != item.path and owner in self.attached_files:
+            self.remove_file(item.path)
+            self.status_label.configure(
+                text=f"{item.name} is identical to {self.attached_files[owner].name}; kept one copy")
+            return True
+        self._digest_index[digest] = item.path
+        return False
+
+    def report_ingest(self, added, skipped, merged, failed):
+        """Summarize one batch in the status line, with a single dialog for problems"""
+        parts = []
+        if added:
+            parts.append(f"Added {len(added)} file{'s' if len(added) != 1 else ''}")
+        if skipped:
+            parts.append(f"{len(skipped)} already attached")
+        if merged:
+            parts.append(f"{len(merged)} identical to attached files")
+        if failed:
+            parts.append(f"{len(failed)} failed")
+        # A lone merge keeps merge_duplicate's message, which names both files
+        if parts and not (len(merged) == 1 and not (added or skipped or failed)):
+            self.status_label.configure(text=" · ".join(parts))
+
+        if len(skipped) == 1 and not failed and not added:
+            filename = os.path.basename(skipped[0])
             messagebox.showinfo("Duplicate File", f"File '{filename}' is already attached.")
+        elif skipped or failed:
+            lines = [" · ".join(parts)]
+            for title, paths in (("Already attached", skipped), ("Could not attach", failed)):
+                if paths:
+                    lines.append(f"\n{title}:")
+                    lines.extend(f"  {os.path.basename(p)}" for p in paths[:10])
+                    if len(paths) > 10:
+                        lines.append(f"  …and {len(paths) - 10} more")
+            messagebox.showinfo("Attach Files", "\n".join(lines))
+
+    def sync_file_list(self):
+        """Rebuild the list view's snapshot if removals made it stale, then lay out once"""
+        if self._file_list_sync is not None:
+            self.root.after_cancel(self._file_list_sync)
+            self._file_list_sync = None
+        if self._file_list_stale:
+            self.file_list.items = list(self.attached_files.values())
+            self._file_list_stale = False
+        self.file_list.refresh()
+
+    def make_attachment(self, filepath, filename, st=None):
+        """Capture an attachment's metadata once; returns None if it isn't a readable file"""
+        if st is None:
+            try:
+                st = os.stat(filepath)
+            except OSError:
+                return None
+        if not stat.S_ISREG(st.st_mode):
+            return None
+        ext = os.path.splitext(filepath)[1].lower()
+        return Attachment(filepath, filename, st,
+                          icon=self.get_file_icon(filepath),
+                          is_image=PIL_AVAILABLE and ext in IMAGE_EXTENSIONS)
+
+    def request_thumbnail(self, item):
+        """Called when a row is bound to item; shows its thumbnail, decoding in the background if needed"""
+        if not item.is_image:
+            self.request_preview(item)
+            return
+        if item.image is not None:
+            self.thumbnail_loader.request_image(item.path, item.image,
+                                                lambda key, img: self.show_thumbnail(item, item.cache_key, img))
+            return
+        cache = self.thumbnail_loader.cache
+        img = cache.peek(item.cache_key) if cache is not None and item.cache_key else None
+        if img is not None:
+            self.show_thumbnail(item, item.cache_key, img)
+            return
+        self.thumbnail_loader.request(item.path, item.path,
+                                      lambda key, img: self.show_thumbnail(item, key, img),
+                                      cache_key=item.cache_key)
+
+    def show_thumbnail(self, item, cache_key, img):
+        item.cache_key = cache_key
+        if img is None:
+            # Not decodable; don't retry on every scroll, but the content may still be previewable
+            item.is_image = False
+            self.request_preview(item)
+            return
+        item.dimensions = item.dimensions or source_dimensions(img)
+        self.file_list.show_thumbnail(item, img)
+
+    def request_preview(self, item):
+        """Describe a non-image attachment in its row, reading the file in the background once"""
+        if item.preview is not None or item.cache_key is None:
             return
-            
-        self.attached_files.append(filepath)
+        preview = self.thumbnail_loader.previews.peek(item.cache_key)
+        if preview is not None:
+            self.show_preview(item, item.cache_key, preview)
+            return
+        self.thumbnail_loader.request_preview(item.path, item.path, item.cache_key,
+                                              lambda key, preview: self.show_preview(item, key, preview))
 
-        if hasattr(self, 'no_files_label') and self.no_files_label.winfo_exists():
-            self.no_files_label.destroy()
+    def show_preview(self, item, cache_key, preview):
+        if preview is None or item.path not in self.attached_files:
+            return
+        item.preview = preview
+        if preview["kind"] == "image":
+            if PIL_AVAILABLE and os.path.splitext(item.path)[1].lower() not in IMAGE_EXTENSIONS:
+                # An image behind a wrong or missing extension (the preview stays set, so a
+                # failed decode doesn't come back here)
+                item.is_image = True
+                item.icon = KIND_ICONS["image"]
+                self.file_list.show_preview(item)
+                self.request_thumbnail(item)
+            return
+        if item.icon == "📁" and preview["kind"] in KIND_ICONS:
+            item.icon = KIND_ICONS[preview["kind"]]
+        self.file_list.show_preview(item)
+
+    @traced
+    def remove_file(self, filepath):
+        self.thumbnail_loader.cancel(filepath)
+        self.hasher.cancel(filepath)
+        self.hasher.cancel(("dimensions", filepath))
+        if self.preprocessor is not None:
+            self.preprocessor.cancel(filepath)
+        item = self.attached_files.pop(filepath, None)
+        if item is None:
+            return
+        self.screenshot_store.release(filepath)
+        if self.draft is not None:
+            self.draft.record({"op": "remove", "path": filepath})
+        self._size_index.get(item.size, {}).pop(filepath, None)
+        if item.digest is not None and self._digest_index.get(item.digest) == filepath:
+            del self._digest_index[item.digest]
+        if item.cache_key is not None and self.thumbnail_loader.cache is not None:
+            self.thumbnail_loader.cache.release(item.cache_key)
+        # The list snapshot is rebuilt once on the next sync instead of list.remove per file,
+        # and a batch of removals (e.g. merged duplicates) shares one deferred sync
+        self._file_list_stale = True
+        if self._file_list_sync is None:
+            self._file_list_sync = self.root.after_idle(self.sync_file_list)
+
+    @traced
+    def submit(self):
+        self.finish_text_paste()  # the whole paste belongs in the prompt
+        prompt_text = self.prompt_input.get("1.0", "end").strip()
+        if not prompt_text and not self.attached_files:
+            messagebox.showwarning("Missing Input", "Please enter a prompt or attach a file.")
+            return
 
-        item_frame = ctk.CTkFrame(self.file_preview_frame)
-        item_frame.pack(fill="x", pady=5, padx=10)
+        self.persist_screenshots()
+        self.screenshot_store.commit(self.attached_files)
+        if self.preprocessor is not None:
+            self.preprocessor.wait(PREPROCESS_SUBMIT_WAIT)
+            optimized = [item for item in self.attached_files.values() if item.optimized_path is not None]
+            if optimized:
+                log(f"Optimized {len(optimized)} image{'s' if len(optimized) != 1 else ''}, "
+                    f"saving {format_size(sum(item.saved_bytes for item in optimized))}")
+
+        if self.session is not None:
+            result = {"status": "submitted", "prompt": prompt_text,
+                      "attachments": [item.to_record() for item in self.attached_files.values()]}
+            # Clear up while hidden, so the next request only has to show the window
+            self.finish_session(result)
+            self.reset()
+            if self.draft is not None:
+                self.draft.discard()
+            return
+
+        if self.bundle:
+            self.root.withdraw()  # the bundle can take a while; don't leave a frozen window up
+        try:
+            deliver_submission(prompt_text, self.attached_files.values(), self.output_format,
+                               self.inline_content, self.bundle, self.bundle_format, self.bundle_compression)
+        except OSError as e:
+            # Bring the window back so the prompt isn't lost in an invisible process
+            self.root.deiconify()
+            messagebox.showerror("Submit Failed", f"Could not write the submission: {e}")
+            return
+        if self.draft is not None:
+            self.draft.discard()
+        self.root.destroy()
 
-        preview_frame = ctk.CTkFrame(item_frame, fg_color="transparent")
-        preview_frame.pack(side="left", padx=10, pady=10)
+    def serve(self, socket_path):
+        """Stay resident with the window hidden, showing it once per client request"""
+        self.root.withdraw()
+        self.root.protocol("WM_DELETE_WINDOW", self.cancel_session)
+        self.server = PromptServer(self, socket_path)
+        # Warm up the imports the first paste or thumbnail would otherwise pay for
+        if PIL_AVAILABLE:
+            threading.Thread(target=load_pil, daemon=True).start()
+        log(f"serving prompts on {socket_path}")
+        self.run()
+
+    def begin_session(self, request, reply):
+        """Show the pre-built window for one client request; reply(result) is called on submit or close"""
+        if self.session is not None:
+            reply({"status": "busy"})
+            return
+        self.session = reply
+        if request.get("prompt"):
+            self.prompt_input.delete("1.0", "end")
+            self.prompt_input.insert("1.0", request["prompt"])
+        if request.get("files"):
+            self.add_files(request["files"], quiet=True)
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+        self.prompt_input.focus_set()
+
+    def finish_session(self, result):
+        reply, self.session = self.session, None
+        self.root.withdraw()
+        if reply is not None:
+            reply(result)
+
+    def cancel_session(self):
+        """Window closed in server mode: hide it and keep the draft for the next request"""
+        self.finish_session({"status": "cancelled"})
+
+    def reset(self):
+        """Empty the prompt and attachments, ready for the next request"""
+        self.cancel_text_paste()
+        self.prompt_input.delete("1.0", "end")
+        self.clear_all_files()
+        self.status_label.configure(text="")
+
+    def busy(self):
+        """True while background work (thumbnails, hashing, screenshot encoding, optimizing) is outstanding"""
+        return (self.thumbnail_loader.busy() or self.hasher.busy()
+                or (self.preprocessor is not None and self.preprocessor.busy())
+                or bool(self.pending_screenshots) or not self._ui_calls.empty())
+
+    def shutdown(self):
+        """Stop background workers and flush caches"""
+        if self.monitor is not None:
+            self.monitor.close()
+        if self.server is not None:
+            self.server.close()
+            if self.session is not None:
+                self.session({"status": "cancelled"})
+        if self.clipboard_watcher is not None:
+            self.clipboard_watcher.stop()
+        for scanner in self._folder_scans:
+            scanner.cancel()
+        if self.draft is not None:
+            self.draft.close()
+        self.thumbnail_loader.shutdown()
+        self.hasher.shutdown()
+        if self.preprocessor is not None:
+            self.preprocessor.shutdown()
+        self.screenshot_writer.shutdown(wait=True)
+        self.screenshot_store.close()
 
-        # Try to show image preview for image files, otherwise show icon
+    def run(self):
         try:
-            ext = os.path.splitext(filepath)[1].lower()
-            if PIL_AVAILABLE and ext in ['.png', '.jpg', '.jpeg', '.gif', '.bmp', '.tiff', '.webp']:
-                img = Image.open(filepath)
-                img.thumbnail((80, 80), Image.Resampling.LANCZOS)
-                photo = ImageTk.PhotoImage(img)
+            self.root.mainloop()
+        finally:
+            self.shutdown()
 
-                preview_label = ctk.CTkLabel(preview_frame, image=photo, text="")
-                preview_label.image = photo
-                preview_label.pack()
 
-                self.file_previews.append(photo)
+def write_submission(out, prompt_text, attachments, output_format="text", inline_content=False):
+    """Write the submitted prompt and attachments to out, one attachment at a time.
+
+    attachments are Attachment records, so nothing is re-stat'ed here. The
+    json and ndjson formats emit one record per attachment; with
+    inline_content each record carries the file's bytes as base64 (the
+    optimized copy, if there is one), streamed in fixed-size chunks.
+    """
+    if output_format == "text":
+        if prompt_text:
+            out.write(prompt_text + "\n")
+        header_written = False
+        for item in attachments:
+            if not header_written:
+                out.write("\n--- ATTACHED FILES ---\n")
+                header_written = True
+            if item.size is not None:
+                out.write(f"File: {item.path}\n")
+                out.write(f"Size: {format_size(item.size)} ({item.size} bytes)\n")
+                out.write(f"Type: {item.type_text}\n")
+                if item.optimized_path is not None:
+                    out.write(f"Optimized: {item.optimized_path} ({format_size(item.optimized_size)}, "
+                              f"saves {format_size(item.saved_bytes)})\n")
             else:
-                icon = self.get_file_icon(filepath)
-                preview_label = ctk.CTkLabel(preview_frame, text=icon, font=ctk.CTkFont(size=24))
-                preview_label.pack()
-        except:
-            icon = self.get_file_icon(filepath)
-            preview_label = ctk.CTkLabel(preview_frame, text=icon, font=ctk.CTkFont(size=24))
-            preview_label.pack()
-
-        info_frame = ctk.CTkFrame(item_frame, fg_color="transparent")
-        info_frame.pack(side="left", fill="x", expand=True, padx=10, pady=10)
-
-        name_label = ctk.CTkLabel(info_frame, text=filename,
-                                 font=ctk.CTkFont(size=12, weight="bold"),
-                                 anchor="w")
-        name_label.pack(fill="x", anchor="w")
-
-        try:
-            size = os.path.getsize(filepath)
-            size_text = f"{size / 1024:.1f} KB" if size < 1024 * 1024 else f"{size / (1024 * 1024):.1f} MB"
-            size_label = ctk.CTkLabel(info_frame, text=size_text,
-                                     font=ctk.CTkFont(size=10),
-                                     text_color=("gray60", "gray40"),
-                                     anchor="w")
-            size_label.pack(fill="x", anchor="w")
-        except:
+                out.write(f"File (NOT FOUND): {item.path}\n")
+    elif output_format == "ndjson":
+        out.write(json.dumps({"record": "prompt", "text": prompt_text}) + "\n")
+        for item in attachments:
+            write_attachment_record(out, dict(record="attachment", **item.to_record()), inline_content)
+            out.write("\n")
+    elif output_format == "json":
+        out.write('{"prompt": %s, "attachments": [' % json.dumps(prompt_text))
+        for index, item in enumerate(attachments):
+            out.write(", " if index else "")
+            write_attachment_record(out, item.to_record(), inline_content)
+        out.write("]}\n")
+    else:
+        raise ValueError(f"Unknown output format: {output_format}")
+
+
+def write_attachment_record(out, record, inline_content=False):
+    """Write one JSON object, appending a streamed content_base64 field if requested"""
+    if not inline_content or not record["exists"]:
+        out.write(json.dumps(record))
+        return
+    try:
+        f = open(record.get("optimized_path") or record["path"], "rb")
+    except OSError as e:
+        record["content_error"] = str(e)
+        out.write(json.dumps(record))
+        return
+    with f:
+        # Base64 never needs JSON escaping, so the string can be written in pieces
+        out.write(json.dumps(record)[:-1] + ', "content_base64": "')
+        while True:
+            chunk = f.read(INLINE_CHUNK_SIZE)
+            if not chunk:
+                break
+            out.write(base64.b64encode(chunk).decode("ascii"))
+        out.write('"}')
+
+
+@functools.lru_cache(maxsize=None)
+def zstd_module():
+    """The stdlib (3.14+) or zstandard package zstd module, or None"""
+    for name in ("compression.zstd", "zstandard"):
+        try:
+            return importlib.import_module(name)
+        except ImportError:
             pass
+    return None
 
-        remove_btn = ctk.CTkButton(item_frame, text="🗑️",
-                                  command=lambda: self.remove_file(filepath, item_frame),
-                                  width=40,
-                                  height=40,
-                                  corner_radius=8,
-                                  fg_color=("#ef4444", "#dc2626"),
-                                  hover_color=("#dc2626", "#b91c1c"))
-        remove_btn.pack(side="right", padx=10, pady=10)
-
-    def remove_file(self, filepath, frame):
-        if filepath in self.attached_files:
-            self.attached_files.remove(filepath)
-        frame.destroy()
-
-        if not self.attached_files:
-            self.no_files_label = ctk.CTkLabel(self.file_preview_frame,
-                                              text="No files attached yet. Drag & drop files here or use buttons below.",
-                                              font=ctk.CTkFont(size=11),
-                                              text_color=("gray60", "gray40"))
-            self.no_files_label.pack(pady=20)
 
-    def submit(self):
-        prompt_text = self.prompt_input.get("1.0", "end").strip()
-        if not prompt_text and not self.attached_files:
-            messagebox.showwarning("Missing Input", "Please enter a prompt or attach a file.")
-            return
+def bundle_encoding(filepath, size, compression="auto"):
+    """How a file is compressed inside a bundle: None, "gzip" or "zstd", chosen by its type"""
+    if compression == "none" or size < BUNDLE_COMPRESS_MIN:
+        return None
+    ext = os.path.splitext(filepath)[1].lower()
+    mime = mimetypes.guess_type(filepath)[0] or ""
+    if ext not in BUNDLE_COMPRESSIBLE_EXTENSIONS and not mime.startswith("text/"):
+        return None
+    if compression == "auto":
+        return "zstd" if zstd_module() is not None else "gzip"
+    return compression
 
-        if prompt_text:
-            print(prompt_text)
 
-        if self.attached_files:
-            print("\n--- ATTACHED FILES ---")
-            for file_path in self.attached_files:
-                if os.path.exists(file_path):
-                    print(f"File: {file_path}")
-                    try:
-                        size = os.path.getsize(file_path)
-                        size_text = f"{size / 1024:.1f} KB" if size < 1024 * 1024 else f"{size / (1024 * 1024):.1f} MB"
-                        print(f"Size: {size_text} ({size} bytes)")
-                        print(f"Type: {os.path.splitext(file_path)[1].upper() or 'No extension'}")
-                    except:
-                        print("Size: Unknown")
-                else:
-                    print(f"File (NOT FOUND): {file_path}")
+def member_name(index, name):
+    """Archive path for the index'th attachment, keeping folder-relative names but nothing above them"""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".", "..")]
+    return f"files/{index:04d}/" + ("/".join(parts) or "file")
 
-        self.root.destroy()
 
-    def run(self):
-        self.root.mainloop()
+class BundleStream:
+    """Binary output for write_bundle that hands whole-file copies to the kernel when it can.
+
+    With a real file descriptor, file contents go through copy_file_range
+    (regular file to regular file) or sendfile, and only fall back to a
+    fixed-size buffer where those aren't supported.
+    """
+
+    def __init__(self, out):
+        self.out = out
+        self.written = 0
+        try:
+            out.flush()
+            self.fd = out.fileno()
+        except (AttributeError, OSError, ValueError):
+            self.fd = None
+        self._regular = self.fd is not None and stat.S_ISREG(os.fstat(self.fd).st_mode)
+        self._buffer = None
+
+    def write(self, data):
+        if self.fd is None:
+            self.out.write(data)
+        else:
+            view = memoryview(data)
+            while view:
+                view = view[os.write(self.fd, view):]
+        self.written += len(data)
+
+    def copy_from(self, f, size):
+        """Copy exactly size bytes from binary file f, zero-filling if it turns out shorter"""
+        remaining = size
+        if self.fd is not None:
+            remaining = self._kernel_copy(f.fileno(), remaining)
+        if remaining:
+            if self._buffer is None:
+                self._buffer = bytearray(BUNDLE_CHUNK_SIZE)
+            view = memoryview(self._buffer)
+            while remaining:
+                n = f.readinto(view[:min(remaining, len(view))])
+                if not n:
+                    log(f"{f.name} shrank while being bundled; padded with zeros")
+                    self.write(bytes(remaining))
+                    return
+                self.write(view[:n])
+                remaining -= n
+            return
+        self.written += size
+
+    def _kernel_copy(self, src, remaining):
+        # Both calls advance the file offsets, so a partial copy can be finished by the next method
+        copied = 0
+        for method in ("copy_file_range", "sendfile"):
+            if method == "copy_file_range" and not (self._regular and hasattr(os, "copy_file_range")):
+                continue
+            if method == "sendfile" and not hasattr(os, "sendfile"):
+                continue
+            try:
+                while remaining:
+                    if method == "copy_file_range":
+                        n = os.copy_file_range(src, self.fd, remaining)
+                    else:
+                        n = os.sendfile(self.fd, src, None, remaining)
+                    if not n:
+                        break
+                    remaining -= n
+                    copied += n
+            except OSError:
+                continue  # e.g. EXDEV, EINVAL, or sendfile to a non-socket on macOS
+            break
+        if remaining:
+            # The buffered fallback counts what it writes itself
+            self.written += copied
+        return remaining
+
+
+def write_bundle(out, prompt_text, attachments, archive_format="tar", compression="auto"):
+    """Stream the prompt, a manifest and the attached files into one tar or zip archive.
+
+    manifest.json comes first, so a reader can act on it before the files
+    arrive; each attachment record gains the archive member holding its
+    content (the optimized copy, if there is one) and that member's encoding.
+    Tar members are compressed individually by type (see bundle_encoding) and
+    copied by the kernel when stored; zip members are deflated or stored.
+    Nothing is read into memory whole.
+    """
+    members = []
+    records = []
+    for index, item in enumerate(attachments, 1):
+        record = item.to_record()
+        source = item.optimized_path or item.path
+        if item.size is None:
+            record.update(member=None, encoding=None)
+        else:
+            encoding = bundle_encoding(source, item.optimized_size or item.size, compression)
+            if archive_format == "zip" and encoding is not None:
+                encoding = "deflate"
+            name = member_name(index, item.name)
+            if item.optimized_path is not None:
+                name = os.path.splitext(name)[0] + os.path.splitext(item.optimized_path)[1]
+            name += {"gzip": ".gz", "zstd": ".zst"}.get(encoding, "")
+            record.update(member=name, encoding=encoding)
+            members.append((name, source, encoding))
+        records.append(record)
+    manifest = json.dumps({"prompt": prompt_text, "created": datetime.now().astimezone().isoformat(),
+                           "attachments": records}, indent=2).encode("utf-8")
+
+    if archive_format == "zip":
+        write_zip_bundle(out, manifest, prompt_text, members)
+    elif archive_format == "tar":
+        write_tar_bundle(out, manifest, prompt_text, members)
+    else:
+        raise ValueError(f"Unknown bundle format: {archive_format}")
+
+
+def write_tar_bundle(out, manifest, prompt_text, members):
+    import tarfile
+    stream = BundleStream(out)
+    now = time.time()
+
+    def header(name, size, mtime):
+        info = tarfile.TarInfo(name)
+        info.size = size
+        info.mtime = int(mtime)
+        info.mode = 0o644
+        # PAX headers carry long names and sizes beyond 8 GiB
+        stream.write(info.tobuf(format=tarfile.PAX_FORMAT))
+
+    def pad():
+        if stream.written % tarfile.BLOCKSIZE:
+            stream.write(bytes(tarfile.BLOCKSIZE - stream.written % tarfile.BLOCKSIZE))
+
+    for name, data in (("manifest.json", manifest), ("prompt.txt", prompt_text.encode("utf-8"))):
+        header(name, len(data), now)
+        stream.write(data)
+        pad()
+
+    for name, source, encoding in members:
+        try:
+            f = open(source, "rb")
+        except OSError as e:
+            log(f"Could not bundle {source}: {e}")
+            continue
+        with f:
+            st = os.fstat(f.fileno())
+            if encoding is None:
+                header(name, st.st_size, st.st_mtime)
+                stream.copy_from(f, st.st_size)
+            else:
+                import tempfile
+                # The compressed size has to be in the header, so it is measured first
+                with tempfile.SpooledTemporaryFile(max_size=BUNDLE_SPOOL_MAX) as spool:
+                    compress_stream(f, spool, encoding)
+                    size = spool.tell()
+                    spool.seek(0)
+                    header(name, size, st.st_mtime)
+                    if size > BUNDLE_SPOOL_MAX:
+                        stream.copy_from(spool, size)  # rolled over to a real file
+                    else:
+                        # Still in memory: fileno() would force it out to disk
+                        stream.write(spool.read())
+        pad()
+
+    # End-of-archive marker, padded to a whole record like tarfile does
+    stream.write(bytes(2 * tarfile.BLOCKSIZE))
+    if stream.written % tarfile.RECORDSIZE:
+        stream.write(bytes(tarfile.RECORDSIZE - stream.written % tarfile.RECORDSIZE))
+    if stream.fd is None:
+        out.flush()
+
+
+def compress_stream(src, dst, encoding):
+    """Compress src into dst a chunk at a time with gzip or zstd"""
+    if encoding == "gzip":
+        import zlib
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    else:
+        module = zstd_module()
+        if module.__name__ == "zstandard":
+            compressor = module.ZstdCompressor(level=3).compressobj()
+        else:
+            compressor = module.ZstdCompressor(level=3)
+    buffer = bytearray(BUNDLE_CHUNK_SIZE)
+    view = memoryview(buffer)
+    while True:
+        n = src.readinto(buffer)
+        if not n:
+            break
+        dst.write(compressor.compress(view[:n]))
+    dst.write(compressor.flush())
+
+
+def write_zip_bundle(out, manifest, prompt_text, members):
+    import zipfile
+    # zipfile writes data descriptors when out can't seek, so stdout works too
+    with zipfile.ZipFile(out, "w", allowZip64=True) as archive:
+        archive.writestr("manifest.json", manifest, zipfile.ZIP_DEFLATED)
+        archive.writestr("prompt.txt", prompt_text, zipfile.ZIP_DEFLATED)
+        for name, source, encoding in members:
+            try:
+                info = zipfile.ZipInfo.from_file(source, name)
+                f = open(source, "rb")
+            except OSError as e:
+                log(f"Could not bundle {source}: {e}")
+                continue
+            info.compress_type = zipfile.ZIP_DEFLATED if encoding else zipfile.ZIP_STORED
+            # zip members need a CRC of their data, so they go through a buffer rather than the kernel
+            with f, archive.open(info, "w") as member:
+                shutil.copyfileobj(f, member, BUNDLE_CHUNK_SIZE)
+    out.flush()
+
+
+def deliver_submission(prompt_text, attachments, output_format="text", inline_content=False,
+                       bundle=None, bundle_format="tar", bundle_compression="auto"):
+    """Write submit's result: the report on stdout, plus a bundle if one was asked for.
+
+    With bundle "-" the bundle replaces the report on stdout; any other
+    bundle path is written atomically and the report still goes to stdout.
+    Raises OSError if the bundle can't be written, leaving no partial file.
+    """
+    attachments = list(attachments)
+    if bundle == "-":
+        sys.stdout.flush()
+        write_bundle(sys.stdout.buffer, prompt_text, attachments, bundle_format, bundle_compression)
+        return
+    if bundle:
+        tmp_path = bundle + ".part"
+        try:
+            with open(tmp_path, "wb") as out:
+                write_bundle(out, prompt_text, attachments, bundle_format, bundle_compression)
+            os.replace(tmp_path, bundle)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+        log(f"Wrote {bundle} ({format_size(os.path.getsize(bundle))})")
+    write_submission(sys.stdout, prompt_text, attachments, output_format, inline_content)
+    sys.stdout.flush()
+
+
+def run_headless(args):
+    """Produce submit's output from --prompt/--file without importing any GUI toolkit (or Pillow, unless it's needed)"""
+    prompt_text = sys.stdin.read() if args.prompt == "-" else (args.prompt or "")
+    prompt_text = prompt_text.strip()
+    # Same de-duplication as the window: first occurrence of a path wins
+    file_paths = list(dict.fromkeys(args.files))
+    if not prompt_text and not file_paths:
+        log("Please enter a prompt or attach a file.")
+        return 2
+    attachments = [stat_attachment(path) for path in file_paths]
+    if (args.format != "text" or args.bundle) and PIL_AVAILABLE:
+        # Only the records report image sizes; each costs a header read, not a decode
+        for item in attachments:
+            if item.size is not None and os.path.splitext(item.path)[1].lower() in IMAGE_EXTENSIONS:
+                item.dimensions = image_dimensions(item.path)
+    if args.optimize_images and PIL_AVAILABLE:
+        preprocess_attachments(attachments, args.max_edge, args.optimize_format, args.optimize_quality)
+    try:
+        deliver_submission(prompt_text, attachments, args.format, args.inline_content,
+                           args.bundle, args.bundle_format, args.bundle_compression)
+    except OSError as e:
+        log(f"Could not write the submission: {e}")
+        return 1
+    return 0
+
+
+def run_client(args):
+    """Ask a resident --serve process for a prompt and print the result the way submit would"""
+    import socket
+    prompt_text = sys.stdin.read() if args.prompt == "-" else (args.prompt or "")
+    request = {"request": "prompt", "prompt": prompt_text,
+               "files": [os.path.abspath(path) for path in dict.fromkeys(args.files)]}
+    path = args.client or default_socket_path()
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError as e:
+        log(f"No prompt server at {path} ({e}); start one with --serve")
+        return 2
+    with sock, sock.makefile("rwb") as f:
+        f.write((json.dumps(request) + "\n").encode("utf-8"))
+        f.flush()
+        reply = json.loads(f.readline() or b"null") or {"status": "error", "error": "no reply"}
+
+    status = reply.get("status")
+    if status == "submitted":
+        try:
+            deliver_submission(reply["prompt"],
+                               (Attachment.from_record(record) for record in reply["attachments"]),
+                               args.format, args.inline_content, args.bundle, args.bundle_format,
+                               args.bundle_compression)
+        except OSError as e:
+            log(f"Could not write the submission: {e}")
+            return 1
+        return 0
+    if status == "cancelled":
+        log("The prompt window was closed without submitting.")
+        return 1
+    log(f"Prompt server error: {reply.get('error') or status}")
+    return 2
+
+
+def stat_attachment(filepath):
+    """Attachment record for a path, stat'ed once"""
+    try:
+        st = os.stat(filepath)
+    except OSError:
+        st = None
+    return Attachment(filepath, os.path.basename(filepath), st)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Collect a prompt and file attachments for an AI assistant.")
+    parser.add_argument("--prompt", help="prompt text, or - to read it from stdin; skips the window")
+    parser.add_argument("--file", dest="files", action="append", default=[], metavar="PATH",
+                        help="attach a file (repeatable); skips the window")
+    parser.add_argument("--screenshot-format", choices=sorted(SCREENSHOT_FORMATS),
+                        help="how pasted screenshots are stored (default: png)")
+    parser.add_argument("--screenshot-dir", help="where pasted screenshots are kept")
+    parser.add_argument("--screenshot-max-size", type=float, metavar="MB",
+                        help="evict unattached screenshots once they total more than this "
+                             f"(default $USERINPUT_SCREENSHOT_MAX_MB or {SCREENSHOT_MAX_BYTES // 1024 ** 2})")
+    parser.add_argument("--screenshot-max-age", type=float, metavar="DAYS",
+                        help="evict unattached screenshots older than this "
+                             f"(default $USERINPUT_SCREENSHOT_MAX_DAYS or {SCREENSHOT_MAX_AGE // (24 * 60 * 60)})")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default="text",
+                        help="submit output: free-form text (default), one JSON document, or NDJSON records")
+    parser.add_argument("--inline-content", action="store_true",
+                        help="with --format json/ndjson, include each file's content as base64")
+    parser.add_argument("--bundle", metavar="PATH",
+                        help="also write the prompt, a manifest and every attached file into one archive at PATH; "
+                             "- writes it to stdout instead of the report")
+    parser.add_argument("--bundle-format", choices=BUNDLE_FORMATS, default="tar",
+                        help="with --bundle, a tar or a zip archive (default tar)")
+    parser.add_argument("--bundle-compression", choices=BUNDLE_COMPRESSION, default="auto",
+                        help="with --bundle, how compressible file types are compressed; media and archives are "
+                             "always stored as-is (default auto: zstd if available, else gzip; zip uses deflate)")
+    parser.add_argument("--paste-attach-threshold", type=int, default=PASTE_ATTACH_THRESHOLD, metavar="CHARS",
+                        help="offer text pastes at least this long as a .txt attachment; 0 disables "
+                             f"(default {PASTE_ATTACH_THRESHOLD})")
+    parser.add_argument("--optimize-images", action="store_true",
+                        help="downscale and re-encode attached images for upload; submit reports the optimized copy")
+    parser.add_argument("--max-edge", type=int, default=PREPROCESS_MAX_EDGE, metavar="PIXELS",
+                        help=f"with --optimize-images, the longest side of an optimized image (default {PREPROCESS_MAX_EDGE})")
+    parser.add_argument("--optimize-format", choices=sorted(PREPROCESS_FORMATS), default=PREPROCESS_FORMAT,
+                        help=f"with --optimize-images, the format to re-encode to (default {PREPROCESS_FORMAT})")
+    parser.add_argument("--optimize-quality", type=int, default=PREPROCESS_QUALITY, metavar="Q",
+                        help=f"with --optimize-images, jpeg/webp quality (default {PREPROCESS_QUALITY})")
+    parser.add_argument("--folder-include", action="append", default=[], metavar="GLOB",
+                        help="only attach files from dropped folders whose name or relative path matches (repeatable)")
+    parser.add_argument("--folder-exclude", action="append", default=[], metavar="GLOB",
+                        help="skip matching files and folders when scanning dropped folders, "
+                             f"in addition to {', '.join(FOLDER_EXCLUDE)} (repeatable)")
+    parser.add_argument("--folder-max-files", type=int, default=FOLDER_MAX_FILES, metavar="N",
+                        help=f"attach at most N files per dropped folder (default {FOLDER_MAX_FILES})")
+    parser.add_argument("--folder-max-size", type=float, default=FOLDER_MAX_BYTES / 1024 ** 2, metavar="MB",
+                        help=f"attach at most this many MB per dropped folder (default {FOLDER_MAX_BYTES // 1024 ** 2})")
+    parser.add_argument("--no-draft", dest="draft", action="store_false",
+                        help="don't restore the last unsubmitted draft or save this one")
+    parser.add_argument("--auto-paste", action="store_true",
+                        help="watch the clipboard and attach new images automatically")
+    parser.add_argument("--serve", nargs="?", const="", metavar="SOCKET",
+                        help="stay resident with the window pre-built and hidden, showing it for each --client "
+                             f"request (default socket: $XDG_RUNTIME_DIR/{SERVER_SOCKET_NAME})")
+    parser.add_argument("--client", nargs="?", const="", metavar="SOCKET",
+                        help="get the prompt from a --serve process; --prompt/--file pre-fill its window")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="record main-loop stalls and handler timings to a Chrome/Perfetto trace file")
+    parser.add_argument("--stall-threshold-ms", type=float, default=100,
+                        help="with --trace, main-loop delays longer than this count as stalls (default 100)")
+    args = parser.parse_args(argv)
+    if args.bundle and args.bundle != "-":
+        directory = os.path.dirname(os.path.abspath(args.bundle))
+        if not os.path.isdir(directory):
+            parser.error(f"--bundle: directory {directory} does not exist")
+    if args.bundle and args.bundle_compression == "zstd" and zstd_module() is None:
+        parser.error("--bundle-compression zstd needs Python 3.14+ or the zstandard package")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.client is not None:
+        return run_client(args)
+    if (args.prompt is not None or args.files) and args.serve is None:
+        return run_headless(args)
+
+    app = PromptInput(screenshot_format=args.screenshot_format, screenshot_dir=args.screenshot_dir,
+                      screenshot_max_bytes=(int(args.screenshot_max_size * 1024 ** 2)
+                                            if args.screenshot_max_size is not None else None),
+                      screenshot_max_age=(args.screenshot_max_age * 24 * 60 * 60
+                                          if args.screenshot_max_age is not None else None),
+                      output_format=args.format, inline_content=args.inline_content,
+                      trace_path=args.trace, stall_threshold_ms=args.stall_threshold_ms,
+                      paste_attach_threshold=args.paste_attach_threshold, auto_paste=args.auto_paste,
+                      optimize_images=args.optimize_images, optimize_max_edge=args.max_edge,
+                      optimize_format=args.optimize_format, optimize_quality=args.optimize_quality,
+                      draft=args.draft, folder_include=args.folder_include,
+                      folder_exclude=FOLDER_EXCLUDE + tuple(args.folder_exclude),
+                      folder_max_files=args.folder_max_files, folder_max_bytes=int(args.folder_max_size * 1024 ** 2),
+                      bundle=args.bundle, bundle_format=args.bundle_format,
+                      bundle_compression=args.bundle_compression)
+    if args.serve is not None:
+        app.serve(args.serve or default_socket_path())
+    else:
+        app.run()
+    return 0
 
 
 if __name__ == "__main__":
-    app = PromptInput()
-    app.run()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file